@@ -1,6 +1,7 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
 # UTF-8 for the mathematical symbols in comments
+from collections import OrderedDict
 from math import factorial
 from fractions import gcd
 from typing import Iterator
@@ -112,33 +113,409 @@ def conjugacy_class_size(partition): # type: (list[int]) -> int
         denominator *= (num ** f) * factorial(f)
 
     # Answer will always be an int
-    return int(factorial(n) / denominator)
+    return factorial(n) // denominator
 
 
-def solution(w, h, s): # type: (int, int, int) -> str
+'''
+    Partitions with multiplicities
+
+    Most partitions repeat a few parts lots of times (1 + 1 + 1 + ... most of
+    all), so it's quicker to work with (part, multiplicity) pairs than with
+    every part, e.g. 3 + 1 + 1 + 1 is [(3, 1), (1, 3)].
+
+    partitions_with_multiplicities() goes through the partitions in reverse
+    lexicographic order, without any recursion, changing the last few pairs
+    each time:
+      - take away all the 1s, and one of the smallest part k > 1
+      - split that amount up into as many k - 1s as fit, and the rest
+    e.g. 4 + 2 + 1 + 1 -> 4 + 1 + 1 + 1 + 1 and 4 + 1 + 1 + 1 + 1 -> 3 + 3
+
+    The conjugacy class size is n! / ∏ (k^m × m!) over the (k, m) pairs, so
+    when a pair changes, the class size can just be updated by multiplying by
+    the old pair's k^m × m! and dividing by the new one's - the result is
+    always a whole number, as it's the class size of the next partition.
+'''
+def multiplicity_factor(part, multiplicity): # type: (int, int) -> int
+    return part ** multiplicity * factorial(multiplicity)
+
+# Output: every partition of n, as a list of (part, multiplicity) pairs with
+#         the parts in decreasing order, and its conjugacy class size
+def partitions_with_multiplicities(n):
+    # type: (int) -> Iterator[tuple[list[tuple[int, int]], int]]
+    if n == 0:
+        yield [], 1
+        return
+
+    pairs = [(n, 1)]
+    class_size = factorial(n) // multiplicity_factor(n, 1)
+
+    while True:
+        yield list(pairs), class_size
+
+        removed = 1
+        added = 1
+        remaining = 0
+
+        # Take away all the 1s
+        if pairs[-1][0] == 1:
+            remaining = pairs[-1][1]
+            removed *= multiplicity_factor(*pairs.pop())
+
+        if not pairs:
+            return
+
+        # And one of the smallest part that's left
+        part, multiplicity = pairs.pop()
+        removed *= multiplicity_factor(part, multiplicity)
+        remaining += part
+        if multiplicity > 1:
+            pairs.append((part, multiplicity - 1))
+            added *= multiplicity_factor(part, multiplicity - 1)
+
+        # Split it up into parts of part - 1 (and the rest)
+        quotient, rest = divmod(remaining, part - 1)
+        pairs.append((part - 1, quotient))
+        added *= multiplicity_factor(part - 1, quotient)
+        if rest:
+            pairs.append((rest, 1))
+            added *= multiplicity_factor(rest, 1)
+
+        class_size = class_size * removed // added
+
+
+'''
+    Only the s ^ (exponent) part of each term depends on s, so the sum can be
+    worked out once for each grid shape as a polynomial in s - the "cycle
+    index" of the group, with every term of the same exponent added together:
+        exponent -> ∑ (conjugacy class size of rows × of columns)
+    There are far fewer distinct exponents than pairs of partitions, and the
+    polynomial can then be evaluated for as many values of s as needed.
+
+    Swapping w and h gives the same group, so it's stored once for both.
+
+    It still goes through every pair of partitions, p(w) × p(h) of them, so
+    it's fine with one side large (~1.6s for 40 × 10, ~26s for 60 × 8) but
+    slow with both (~2.3s for 25 × 25, ~23s for 30 × 30).
+'''
+# Output: (size of the group, [(exponent, coefficient)] sorted by exponent),
+#         with the coefficients modulo 'modulus' if given
+# 'workers' other than 1 sums the terms in parallel, see
+# sum_cycle_index_terms_in_parallel()
+def create_cycle_index(w, h, modulus=None, workers=1):
+    # type: (int, int, int | None, int | None) -> tuple[int, list[tuple[int, int]]]
     # number of permutations of rows × the number of permutations of columns
     size_group = factorial(w) * factorial(h)
 
-    partitions_w = list(partitions(w))
-    partitions_h = list(partitions(h))
+    column_data = column_cycle_data(h, w)
+    partitions_w = list(partitions_with_multiplicities(w))
+    if modulus is not None:
+        # Then every product of class sizes is below modulus^2, rather than
+        # a huge number
+        column_data = [(col_gcds, col_class_size % modulus)
+                       for col_gcds, col_class_size in column_data]
+        partitions_w = [(row_partition, row_class_size % modulus)
+                        for row_partition, row_class_size in partitions_w]
+
+    if workers == 1:
+        coefficients = sum_cycle_index_terms(column_data, partitions_w)
+    else:
+        coefficients = sum_cycle_index_terms_in_parallel(
+            column_data, partitions_w, modulus, workers)
+    if modulus is not None:
+        coefficients = dict((exponent, coefficient % modulus)
+                            for exponent, coefficient in coefficients.items())
+
+    return size_group, sorted(coefficients.items())
+
+# Output: for every partition of h, the sum of mult_m × gcd(m, n) over its
+#         distinct parts m, for every part n that a partition of w could
+#         have, and its class size
+def column_cycle_data(h, w): # type: (int, int) -> list[tuple[list[int], int]]
+    # gcds[m][n] = gcd(m, n)
+    gcds = [[gcd(m, n) if m and n else 0 for n in range(w + 1)]
+            for m in range(h + 1)]
+
+    return [([sum(multiplicity * gcds[m][n]
+                  for m, multiplicity in col_partition)
+              for n in range(w + 1)], col_class_size)
+            for col_partition, col_class_size in partitions_with_multiplicities(h)]
+
+# Input: column_cycle_data(h, w), and partitions of w with their class sizes
+# Output: exponent -> summed coefficient, for every pair of partitions
+def sum_cycle_index_terms(column_data, partitions_w):
+    # type: (list[tuple[list[int], int]], list[tuple[list[tuple[int, int]], int]]) -> dict[int, int]
+    # exponent -> summed coefficient
+    coefficients = {}
+
+    # The exponent is ∑ over the distinct parts (m, n) of both partitions of
+    # mult_m × mult_n × gcd(m, n), and the column partition's side of it is
+    # already added up for each n
+    for col_gcds, col_class_size in column_data:
+        for row_partition, row_class_size in partitions_w:
+            n_fixed_points_exponent = 0
+
+            for n, multiplicity in row_partition:
+                n_fixed_points_exponent += multiplicity * col_gcds[n]
+
+            coefficients[n_fixed_points_exponent] = (
+                coefficients.get(n_fixed_points_exponent, 0)
+                + col_class_size * row_class_size)
+
+    return coefficients
+
+'''
+    Summing in parallel
+
+    Every term of the sum is independent, so the partitions of w can be split
+    up into shards and summed in separate processes, then the coefficients of
+    each shard added up at the end. Every shard needs all of the column
+    cycle data, so it's sent to each process once, when it starts, rather
+    than with every shard. Modulo a number, each shard's coefficients are
+    reduced before being sent back.
+
+    Timings for 30 × 30 (5604 partitions on each side), on a single-core
+    machine - so they only show the overhead of the pool, the speed-up with
+    more cores hasn't been measured:
+        | workers | time  |
+        |:-------:|:-----:|
+        | serial  | 26.2s |
+        |    1    | 26.3s |
+        |    2    | 26.8s |
+        |    4    | 25.8s |
+'''
+# column_cycle_data(h, w) and the modulus, set in each worker process by
+# start_cycle_index_worker()
+WORKER_DATA = {}
+
+def start_cycle_index_worker(column_data, modulus=None):
+    # type: (list[tuple[list[int], int]], int | None) -> None
+    WORKER_DATA['column_data'] = column_data
+    WORKER_DATA['modulus'] = modulus
+
+def sum_cycle_index_shard(partitions_w):
+    # type: (list[tuple[list[tuple[int, int]], int]]) -> dict[int, int]
+    coefficients = sum_cycle_index_terms(WORKER_DATA['column_data'],
+                                         partitions_w)
+    modulus = WORKER_DATA['modulus']
+    if modulus is not None:
+        coefficients = dict((exponent, coefficient % modulus)
+                            for exponent, coefficient in coefficients.items())
+
+    return coefficients
+
+# Output: the same as sum_cycle_index_terms(), but with the coefficients
+#         modulo 'modulus' if given
+# 'workers = None' uses every core, 'workers = 0' sums every shard in this
+# process, without a pool
+def sum_cycle_index_terms_in_parallel(column_data, partitions_w, modulus=None,
+                                      workers=None, num_shards=None):
+    # type: (list[tuple[list[int], int]], list[tuple[list[tuple[int, int]], int]], int | None, int | None, int | None) -> dict[int, int]
+    # Imported here as the Foobar sandbox doesn't allow multiprocessing
+    import multiprocessing
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if num_shards is None:
+        # A few shards per worker, as the shards take different times
+        num_shards = 4 * max(workers, 1)
+
+    shards = [partitions_w[i::num_shards] for i in range(num_shards)]
+
+    if workers == 0:
+        start_cycle_index_worker(column_data, modulus)
+        partial_sums = list(map(sum_cycle_index_shard, shards))
+    else:
+        pool = multiprocessing.Pool(workers, start_cycle_index_worker,
+                                    (column_data, modulus))
+        try:
+            partial_sums = pool.map(sum_cycle_index_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+
+    coefficients = {}
+    for partial_sum in partial_sums:
+        for exponent, coefficient in partial_sum.items():
+            coefficients[exponent] = coefficients.get(exponent, 0) + coefficient
+
+    return coefficients
+
+# Keeps the most recently used cycle indices, up to 'max_size' of them (a
+# "least recently used" cache)
+class CycleIndexCache(object):
+    def __init__(self, max_size=128): # type: (int) -> None
+        self.max_size = max_size
+        # (smaller side, larger side, modulus) -> cycle index, least recently
+        # used first
+        self.cycle_indices = OrderedDict()
+
+    # 'workers' is only used when the cycle index isn't cached yet, see
+    # create_cycle_index()
+    def get(self, w, h, modulus=None, workers=1):
+        # type: (int, int, int | None, int | None) -> tuple[int, list[tuple[int, int]]]
+        key = (min(w, h), max(w, h), modulus)
+
+        if key in self.cycle_indices:
+            # Move to the end, as the most recently used
+            cycle_index = self.cycle_indices.pop(key)
+        else:
+            cycle_index = create_cycle_index(*key, workers=workers)
+
+        self.cycle_indices[key] = cycle_index
+        while len(self.cycle_indices) > self.max_size:
+            self.cycle_indices.popitem(last=False)
+
+        return cycle_index
+
+    def clear(self): # type: () -> None
+        self.cycle_indices.clear()
+
+CYCLE_INDEX_CACHE = CycleIndexCache()
+
+def evaluate_cycle_index(cycle_index, s, modulus=None):
+    # type: (tuple[int, list[tuple[int, int]]], int, int | None) -> int
+    size_group, terms = cycle_index
+
+    if modulus is not None:
+        total = sum(coefficient * pow(s, exponent, modulus)
+                    for exponent, coefficient in terms)
+        # Dividing by the group size is multiplying by its inverse
+        return total * modular_inverse(size_group, modulus) % modulus
 
     total = 0
+    # The exponents are in increasing order, so each power of s is just the
+    # last one times s to the difference
+    power, last_exponent = 1, 0
+    for exponent, coefficient in terms:
+        power *= s ** (exponent - last_exponent)
+        last_exponent = exponent
+        total += coefficient * power
 
-    for col_partition in partitions_h:
-        for row_partition in partitions_w:
-            n_fixed_points_exponent = 0
+    return total // size_group
 
-            for m in col_partition:
-                for n in row_partition:
-                    n_fixed_points_exponent += gcd(m, n)
+# Input: a and modulus with no common factors
+# Output: x such that a × x = 1 (mod modulus), from the extended Euclidean
+#         algorithm
+def modular_inverse(a, modulus): # type: (int, int) -> int
+    old_r, r = a % modulus, modulus
+    old_x, x = 1, 0
 
-            total += (conjugacy_class_size(col_partition)
-                      * conjugacy_class_size(row_partition)
-                      * (s ** n_fixed_points_exponent))
+    while r:
+        quotient = old_r // r
+        old_r, r = r, old_r - quotient * r
+        old_x, x = x, old_x - quotient * x
+
+    if old_r != 1:
+        raise ValueError('%d has no inverse modulo %d' % (a, modulus))
 
-    return str(total / size_group)
+    return old_x % modulus
+
+'''
+    Counting modulo a number
+
+    Dividing by the size of the group only works modulo a number if the group
+    size has an inverse, i.e. it has no factors in common with the modulus -
+    for a prime modulus p, as long as p > w and p > h. Otherwise it's done
+    exactly and then reduced.
+'''
+# Output: number of distinct grids for each number of states in 'states',
+#         modulo 'modulus' if given
+# 'workers' other than 1 works out the cycle index in parallel, see
+# sum_cycle_index_terms_in_parallel()
+def count_configurations(w, h, states, modulus=None, workers=1):
+    # type: (int, int, list[int], int | None, int | None) -> list[int]
+    if modulus is not None and gcd(factorial(w) * factorial(h), modulus) != 1:
+        cycle_index = CYCLE_INDEX_CACHE.get(w, h, workers=workers)
+        return [evaluate_cycle_index(cycle_index, s) % modulus for s in states]
+
+    cycle_index = CYCLE_INDEX_CACHE.get(w, h, modulus, workers)
+    return [evaluate_cycle_index(cycle_index, s, modulus) for s in states]
+
+def solution(w, h, s, modulus=None, workers=1):
+    # type: (int, int, int, int | None, int | None) -> str
+    return str(count_configurations(w, h, [s], modulus, workers)[0])
 
 
 # ============================ Official test-cases ============================
 assert solution(2, 3, 4) == '430'
 assert solution(2, 2, 2) == '7'
+
+# =========== My own, unofficial test cases to help debug behaviour ===========
+# The cycle index gives the same answers as summing over every pair of
+# partitions
+def solution_by_partitions(w, h, s): # type: (int, int, int) -> int
+    total = 0
+    for col_partition in partitions(h):
+        for row_partition in partitions(w):
+            total += (conjugacy_class_size(col_partition)
+                      * conjugacy_class_size(row_partition)
+                      * s ** sum(gcd(m, n) for m in col_partition
+                                 for n in row_partition))
+
+    return total // (factorial(w) * factorial(h))
+
+for w, h in ((1, 1), (2, 3), (3, 2), (4, 5), (6, 6)):
+    assert count_configurations(w, h, range(1, 6)) == [
+        solution_by_partitions(w, h, s) for s in range(1, 6)
+    ], "count_configurations(...) failed!"
+
+# The least recently used cycle index is evicted first, and (w, h) shares
+# its cycle index with (h, w)
+cache = CycleIndexCache(max_size=2)
+first = cache.get(2, 3)
+cache.get(4, 4)
+assert cache.get(3, 2) is first, "CycleIndexCache.get(...) failed!"
+cache.get(5, 1)
+assert list(cache.cycle_indices) == [(2, 3, None), (1, 5, None)], \
+    "CycleIndexCache eviction failed!"
+
+# The partitions with multiplicities are the same as Eppstein's, and have
+# the same class sizes
+for n in range(0, 12):
+    expected = sorted((sorted(p, reverse=True), conjugacy_class_size(p))
+                      for p in partitions(n))
+    found = sorted(([part for part, multiplicity in pairs
+                     for _ in range(multiplicity)], class_size)
+                   for pairs, class_size in partitions_with_multiplicities(n))
+    assert found == expected, "partitions_with_multiplicities(...) failed!"
+
+# Summing the shards separately gives the same terms
+for w, h in ((1, 1), (3, 5), (6, 4)):
+    column_data = column_cycle_data(h, w)
+    partitions_w = list(partitions_with_multiplicities(w))
+    for num_shards in (1, 3, 50):
+        assert sum_cycle_index_terms_in_parallel(
+            column_data, partitions_w, workers=0, num_shards=num_shards) == \
+            sum_cycle_index_terms(column_data, partitions_w), \
+            "sum_cycle_index_terms_in_parallel(...) failed!"
+
+# ... and the same cycle index and counts, modulo a number too
+for w, h in ((3, 5), (6, 4)):
+    for modulus in (None, 1000):
+        assert create_cycle_index(w, h, modulus, workers=0) == \
+            create_cycle_index(w, h, modulus), \
+            "create_cycle_index(..., workers=0) failed!"
+CYCLE_INDEX_CACHE.clear()
+assert solution(9, 4, 20, 10 ** 9 + 7, workers=0) == \
+    str(int(solution(9, 4, 20)) % (10 ** 9 + 7)), \
+    "solution(..., workers=0) failed!"
+
+# Counting modulo a number gives the same as the exact count, modulo it -
+# including when the group size has no inverse
+for w, h, s in ((2, 3, 4), (5, 7, 3), (9, 4, 20)):
+    for modulus in (2, 7, 1000, 10 ** 9 + 7):
+        assert solution(w, h, s, modulus) == \
+            str(int(solution(w, h, s)) % modulus), \
+            "solution(..., " + str(modulus) + ") failed!"
+
+
+# With a real pool. Only when run directly, as processes that are spawned
+# rather than forked import this file again
+if __name__ == '__main__':
+    CYCLE_INDEX_CACHE.clear()
+    assert solution(7, 5, 3, workers=2) == \
+        str(solution_by_partitions(7, 5, 3)), \
+        "solution(..., workers=2) failed!"
+    assert solution(7, 5, 3, 1000, workers=3) == \
+        str(solution_by_partitions(7, 5, 3) % 1000), \
+        "solution(..., 1000, workers=3) failed!"
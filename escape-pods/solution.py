@@ -1,5 +1,8 @@
 #!/usr/bin/env python2.7
+from array import array
 from collections import deque
+from io import BytesIO
+import struct
 
 '''
     Initial observations:
@@ -60,6 +63,9 @@ from collections import deque
 
     It may be worth revisiting this with Orlin's algorithms in the future.
 
+    Update: Dinic's algorithm and push-relabel are now implemented too, for
+    denser graphs and graphs with large capacities - see choose_algorithm()
+
     We can simplify the algorithm by first transforming the graph into a
     single-source, single-sink graph by appending a "supersource" and
     "supersink" respectively i.e.
@@ -77,51 +83,223 @@ from collections import deque
 '''
 
 
-# Assumption: 'graph' is a square matrix
-def add_supersource_and_supersink(sources, sinks, graph):
-    # type: (list[int], list[int], list[list[int]]) -> list[list[int]]
-    supersource = []
-    supersink = []
-    for i in range(len(graph) + 2):
-        # Supersink should never link to anything
-        supersink.append(0)
-
-        if i - 1 in sources:
-            supersource.append(float('inf'))
-        else:
-            supersource.append(0)
-
-    new_graph = []
-    for i in range(len(graph)):
-        new_graph.append([])
-
-        for j in range(len(graph) + 2):
-            # No nodes should connect TO supersource
-            if j == 0:
-                new_graph[i].append(0)
-            elif j == len(graph) + 1:
-                # Connect exits to supersink
-                if i in sinks:
-                    new_graph[i].append(float('inf'))
-                else:
-                    new_graph[i].append(0)
-            # Else copy over previous connections
-            else:
-                # j - 1 because of the offset caused by the addition of the
-                # supersource
-                new_graph[i].append(graph[i][j - 1])
+# Python 2's array has no 'q' (long long) typecode, but its 'l' (long) is
+# 64 bits wide on Linux anyway
+try:
+    CAPACITY_TYPECODE = 'q'
+    array(CAPACITY_TYPECODE)
+except ValueError:
+    CAPACITY_TYPECODE = 'l'
+
+class ResidualGraph(object):
+    '''
+        Sparse residual network, stored as per-node arrays of edge indices.
+
+        Edges are stored in pairs: edge e is a forward edge and edge e ^ 1 is
+        its reverse edge (and vice versa), so finding the reverse of an edge is
+        a single XOR rather than a search through the neighbouring node's edges.
+
+        Iterating over the neighbours of a node only touches the corridors that
+        actually exist, rather than every column of a dense matrix row, so one
+        breadth-first search costs O(n + m) instead of O(n^2).
+    '''
+
+    def __init__(self, num_nodes): # type: (int) -> None
+        self.num_nodes = num_nodes
+        # node -> indices of edges leaving node
+        self.adjacency = [array('l') for _ in range(num_nodes)]
+        # edge -> node the edge points to
+        self.heads = array('l')
+        # edge -> remaining (residual) capacity of the edge
+        # Packed machine integers rather than a list of boxed Python ints
+        self.capacities = array(CAPACITY_TYPECODE)
+
+    def add_node(self): # type: () -> int
+        self.adjacency.append(array('l'))
+        self.num_nodes += 1
 
-    new_graph.insert(0, supersource)
-    new_graph.append(supersink)
+        return self.num_nodes - 1
 
-    return new_graph
+    def add_edge(self, source, target, capacity): # type: (int, int, int) -> int
+        edge = len(self.heads)
 
-# Modifies 'previous_node'!
-def breadth_first_search(graph, source, sink, previous_node):
-    # type: (list[list[int]], int, int, list[int]) -> bool
+        self.heads.append(target)
+        self.capacities.append(capacity)
+        self.adjacency[source].append(edge)
+
+        # Reverse edge starts with no residual capacity
+        self.heads.append(source)
+        self.capacities.append(0)
+        self.adjacency[target].append(edge + 1)
+
+        return edge
+
+
+# Assumption: 'matrix' is a square matrix
+def graph_from_matrix(matrix): # type: (list[list[int]]) -> ResidualGraph
+    graph = ResidualGraph(len(matrix))
+
+    for i, row in enumerate(matrix):
+        for j, capacity in enumerate(row):
+            if capacity > 0:
+                graph.add_edge(i, j, capacity)
+
+    return graph
+
+# edges: (source, target, capacity) triples
+def graph_from_edge_list(num_nodes, edges):
+    # type: (int, list[tuple[int, int, int]]) -> ResidualGraph
+    graph = ResidualGraph(num_nodes)
+
+    for source, target, capacity in edges:
+        if capacity > 0:
+            graph.add_edge(source, target, capacity)
+
+    return graph
+
+'''
+    Loading very large stations
+
+    A dense n x n list of Python ints doesn't fit in memory for tens of
+    thousands of rooms, so these read the corridors one at a time straight into
+    a ResidualGraph (which only stores the corridors that exist, in packed
+    arrays) and never build the 'path' matrix.
+
+    Supported formats:
+        - Text edge list: one "source target capacity" corridor per line,
+          blank lines and lines starting with '#' are skipped
+        - Binary edge list: fixed-width records packed with 'struct', by
+          default three little-endian 32-bit ints per corridor
+        - Binary matrix: the n x n 'path' matrix as raw row-major ints (e.g.
+          written by numpy's tofile()), read through a memory map, so only the
+          pages currently being scanned are held in memory
+'''
+def read_edge_list_text(lines):
+    # type: (Iterable[str]) -> Iterator[tuple[int, int, int]]
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        source, target, capacity = line.split()
+        yield int(source), int(target), int(capacity)
+
+def read_edge_list_binary(stream, record_format='<iii'):
+    # type: (BinaryIO, str) -> Iterator[tuple[int, int, int]]
+    record_size = struct.calcsize(record_format)
+    # Read many records at once, rather than making a call per record
+    chunk_size = record_size * 4096
+
+    # Pipes and sockets can return fewer bytes than asked for, so a record
+    # can be split between reads - keep the start of it for the next chunk
+    leftover = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            if leftover:
+                raise ValueError('Truncated edge list record')
+            return
+
+        chunk = leftover + chunk
+        end = len(chunk) - len(chunk) % record_size
+        leftover = chunk[end:]
+
+        for offset in range(0, end, record_size):
+            yield struct.unpack_from(record_format, chunk, offset)
+
+# buffer: anything 'struct' can read from e.g. bytes, mmap
+# value_format: byte order and type of one matrix entry, e.g. '<i', '<q'
+def graph_from_matrix_buffer(buffer, num_rooms, value_format='<i'):
+    # type: (bytes | mmap, int, str) -> ResidualGraph
+    row_format = value_format[0] + str(num_rooms) + value_format[1:]
+    row_size = struct.calcsize(row_format)
+
+    if len(buffer) < row_size * num_rooms:
+        raise ValueError('Matrix buffer is too small for %d rooms' % num_rooms)
+
+    graph = ResidualGraph(num_rooms)
+
+    # Only one row is unpacked at a time
+    for i in range(num_rooms):
+        row = struct.unpack_from(row_format, buffer, i * row_size)
+        for j, capacity in enumerate(row):
+            if capacity > 0:
+                graph.add_edge(i, j, capacity)
+
+    return graph
+
+# file_format: 'text', 'binary' (edge list) or 'matrix'
+# struct_format: record format for 'binary', value format for 'matrix'
+def load_graph(filename, num_rooms, file_format='text', struct_format=None):
+    # type: (str, int, str, str | None) -> ResidualGraph
+    if file_format == 'text':
+        with open(filename) as f:
+            return graph_from_edge_list(num_rooms, read_edge_list_text(f))
+
+    if file_format == 'binary':
+        with open(filename, 'rb') as f:
+            return graph_from_edge_list(
+                num_rooms, read_edge_list_binary(f, struct_format or '<iii'))
+
+    if file_format == 'matrix':
+        # Imported here as the Foobar sandbox doesn't allow mmap
+        import mmap
+
+        with open(filename, 'rb') as f:
+            matrix = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return graph_from_matrix_buffer(matrix, num_rooms,
+                                                struct_format or '<i')
+            finally:
+                matrix.close()
+
+    raise ValueError('Unknown graph file format: ' + file_format)
+
+'''
+    The supersource and supersink are "virtual" - they are appended to the
+    sparse graph as nodes n and n + 1, so the caller's matrix is never copied
+    and room numbers don't need to be offset.
+
+    Their edges can't have a capacity of infinity in an integer array, but
+    they don't need it:
+        - Flow can only leave an entrance through its corridors, so the flow
+          from the supersource into an entrance is at most the total capacity
+          of the entrance's outgoing corridors
+        - Likewise, the flow from an exit to the supersink is at most the total
+          capacity of the exit's incoming corridors
+'''
+# Modifies 'graph'!
+def add_supersource_and_supersink(sources, sinks, graph):
+    # type: (list[int], list[int], ResidualGraph) -> tuple[int, int]
+    capacities = graph.capacities
+    supersource = graph.add_node()
+    supersink = graph.add_node()
+
+    # Sets, so duplicates are ignored
+    for source in set(sources):
+        # Every edge in the adjacency list is either a forward edge out of
+        # 'source' or the reverse of an edge into it, which has no capacity yet
+        outgoing = sum(capacities[edge] for edge in graph.adjacency[source])
+        if outgoing > 0:
+            graph.add_edge(supersource, source, outgoing)
+
+    for sink in set(sinks):
+        incoming = sum(capacities[edge ^ 1] for edge in graph.adjacency[sink])
+        if incoming > 0:
+            graph.add_edge(sink, supersink, incoming)
+
+    return supersource, supersink
+
+# Modifies 'previous_edge'!
+# previous_edge[node] is the edge used to reach node in the search
+def breadth_first_search(graph, source, sink, previous_edge):
+    # type: (ResidualGraph, int, int, list[int]) -> bool
+    adjacency = graph.adjacency
+    heads = graph.heads
+    capacities = graph.capacities
 
     # Mutable state
-    visited = [False] * len(graph)
+    visited = [False] * graph.num_nodes
     queue = deque()
 
     # Start search from source
@@ -131,34 +309,46 @@ def breadth_first_search(graph, source, sink, previous_node):
     while queue:
         current_node = queue.pop()
 
-        for index, value in enumerate(graph[current_node]):
-            # Easy way to check for neighbouring nodes: value > 0
-            if (visited[index] == False) and (value > 0):
-                queue.appendleft(index)
-                visited[index] = True
-                previous_node[index] = current_node
+        for edge in adjacency[current_node]:
+            neighbour = heads[edge]
+            # Only edges with some residual capacity left can be travelled
+            if (visited[neighbour] == False) and (capacities[edge] > 0):
+                queue.appendleft(neighbour)
+                visited[neighbour] = True
+                previous_edge[neighbour] = edge
+
+                # No need to explore the rest of the graph
+                if neighbour == sink:
+                    return True
 
     # Did we reach the sink?
     return visited[sink]
 
 # Modifies 'graph'!
-def edmonds_karp(graph, source, sink):
-    # type: (list[list[int]], int, int) -> int
-    previous_node = [-1] * len(graph) # Mutated by breadth_first_search()
+# limit: stop after pushing this much flow, or None to find the max flow
+def edmonds_karp(graph, source, sink, limit=None):
+    # type: (ResidualGraph, int, int, int | None) -> int
+    heads = graph.heads
+    capacities = graph.capacities
+    previous_edge = [-1] * graph.num_nodes # Mutated by breadth_first_search()
     max_flow = 0
 
     # While we can reach 'sink' from 'source'
-    while breadth_first_search(graph, source, sink, previous_node):
-        path_flow = float('Inf')
+    while ((limit is None or max_flow < limit)
+           and breadth_first_search(graph, source, sink, previous_edge)):
+        path_flow = capacities[previous_edge[sink]]
+        if limit is not None:
+            path_flow = min(path_flow, limit - max_flow)
 
         # Get the maximum flow possible through the path - which is limited by
         # the minimum flow value along the path...
         # AKA the bottleneck
+        # The reverse edge (edge ^ 1) points back to the previous node
         curr_node = sink
         while curr_node != source:
-            prev_node = previous_node[curr_node]
-            path_flow = min(path_flow, graph[prev_node][curr_node])
-            curr_node = prev_node
+            edge = previous_edge[curr_node]
+            path_flow = min(path_flow, capacities[edge])
+            curr_node = heads[edge ^ 1]
 
         max_flow += path_flow
 
@@ -175,18 +365,466 @@ def edmonds_karp(graph, source, sink):
         # Where "larger bottleneck" means a path with a higher
         current = sink
         while current != source:
-            prev_node = previous_node[current]
-            graph[prev_node][current] -= path_flow
-            graph[current][prev_node] += path_flow
-            current = prev_node
+            edge = previous_edge[current]
+            capacities[edge] -= path_flow
+            capacities[edge ^ 1] += path_flow
+            current = heads[edge ^ 1]
 
     return max_flow
 
-def solution(entrances, exits, path):
-    # type: (list[int], list[int], list[list[int]]) -> int
-    graph = add_supersource_and_supersink(entrances, exits, path)
+# Breadth-first search from 'source' over edges with residual capacity left
+# level[node] is the number of edges on the shortest path from 'source' to
+# 'node', or -1 if 'node' can't be reached
+def create_level_graph(graph, source): # type: (ResidualGraph, int) -> list[int]
+    adjacency = graph.adjacency
+    heads = graph.heads
+    capacities = graph.capacities
+
+    level = [-1] * graph.num_nodes
+    level[source] = 0
+    queue = deque([source])
+
+    while queue:
+        current_node = queue.popleft()
+
+        for edge in adjacency[current_node]:
+            neighbour = heads[edge]
+            if level[neighbour] == -1 and capacities[edge] > 0:
+                level[neighbour] = level[current_node] + 1
+                queue.append(neighbour)
+
+    return level
+
+'''
+    Dinic's algorithm
+    https://cp-algorithms.com/graph/dinic.html
+
+    Rather than augmenting along one shortest path per breadth-first search
+    like Edmonds-Karp, build a "level graph" (only edges going from level i to
+    level i + 1) and saturate *every* shortest path in it before searching
+    again - this is called a "blocking flow".
+    The shortest path length strictly increases after each blocking flow, so
+    there are at most n phases.
+
+    The depth-first search is iterative rather than recursive, as Python's
+    recursion limit would be hit on stations with thousands of rooms.
+    next_arc[node] remembers which edges of 'node' have already been found to
+    be dead-ends in this phase, so each edge is only skipped once per phase.
+'''
+# Modifies 'graph'!
+def dinic(graph, source, sink): # type: (ResidualGraph, int, int) -> int
+    adjacency = graph.adjacency
+    heads = graph.heads
+    capacities = graph.capacities
+    max_flow = 0
+
+    while True:
+        level = create_level_graph(graph, source)
 
-    return edmonds_karp(graph, 0, len(graph) - 1)
+        # No more augmenting paths
+        if level[sink] == -1:
+            return max_flow
+
+        next_arc = [0] * graph.num_nodes
+
+        # Find augmenting paths in the level graph until it is blocked
+        while True:
+            path = [] # edges from 'source' to 'node'
+            node = source
+
+            while node != sink:
+                edges = adjacency[node]
+                i = next_arc[node]
+
+                while i < len(edges):
+                    edge = edges[i]
+                    if (capacities[edge] > 0
+                            and level[heads[edge]] == level[node] + 1):
+                        break
+                    i += 1
+
+                next_arc[node] = i
+
+                if i < len(edges):
+                    # Advance
+                    path.append(edges[i])
+                    node = heads[edges[i]]
+                elif node == source:
+                    # Every edge out of 'source' is a dead-end: blocked
+                    break
+                else:
+                    # Retreat - 'node' is a dead-end, so remove it from the
+                    # level graph and skip the edge that led to it
+                    level[node] = -1
+                    node = heads[path.pop() ^ 1]
+                    next_arc[node] += 1
+
+            if node != sink:
+                break
+
+            path_flow = min(capacities[edge] for edge in path)
+            for edge in path:
+                capacities[edge] -= path_flow
+                capacities[edge ^ 1] += path_flow
+
+            max_flow += path_flow
+
+'''
+    Push-relabel algorithm
+    https://en.wikipedia.org/wiki/Push%E2%80%93relabel_maximum_flow_algorithm
+
+    Instead of searching for whole augmenting paths, flood the graph from the
+    source with as much flow ("excess") as possible, and let each node push
+    its excess "downhill" to neighbours with a lower height, raising
+    ("relabeling") a node when it can't push anywhere.
+
+    The order in which nodes with excess ("active" nodes) are processed gives
+    different time complexities:
+        - FIFO:          O(n^3)
+        - Highest-label: O(n^2 sqrt(m))
+
+    Two heuristics make a big difference in practice:
+        - Global relabeling: periodically set every height to the exact
+          distance to the sink with a reverse breadth-first search
+        - Gap: if no node has height h, then nodes above h can't reach the
+          sink any more, so lift them straight to n
+
+    Only the first phase is run i.e. the excess that can't reach the sink is
+    never returned to the source. This is enough for the *value* of the max
+    flow (the excess that reached the sink), but it means 'graph' is left
+    holding a maximum preflow rather than a maximum flow.
+'''
+# Modifies 'graph'!
+def push_relabel(graph, source, sink, highest_label=False):
+    # type: (ResidualGraph, int, int, bool) -> int
+    n = graph.num_nodes
+    adjacency = graph.adjacency
+    heads = graph.heads
+    capacities = graph.capacities
+
+    height = [0] * n
+    excess = [0] * n
+    next_arc = [0] * n
+    # height -> number of nodes with that height, for the gap heuristic
+    height_count = [0] * (n + 1)
+
+    # Active nodes, either a FIFO queue or buckets of nodes by height
+    queue = deque()
+    buckets = [[] for _ in range(n)]
+    # Highest bucket that may be non-empty
+    highest = [0]
+
+    def activate(node): # type: (int) -> None
+        if highest_label:
+            buckets[height[node]].append(node)
+            highest[0] = max(highest[0], height[node])
+        else:
+            queue.append(node)
+
+    def global_relabel(): # type: () -> None
+        # Nodes that can't reach the sink are lifted out of the way to n
+        for node in range(n):
+            height[node] = n
+        height[sink] = 0
+
+        search = deque([sink])
+        while search:
+            current_node = search.popleft()
+            for edge in adjacency[current_node]:
+                neighbour = heads[edge]
+                # Can flow go from 'neighbour' to 'current_node'?
+                if (height[neighbour] == n and neighbour != source
+                        and capacities[edge ^ 1] > 0):
+                    height[neighbour] = height[current_node] + 1
+                    search.append(neighbour)
+
+        for h in range(n + 1):
+            height_count[h] = 0
+        for node in range(n):
+            height_count[height[node]] += 1
+            next_arc[node] = 0
+
+        queue.clear()
+        for bucket in buckets:
+            del bucket[:]
+        highest[0] = 0
+
+        for node in range(n):
+            if node != sink and excess[node] > 0 and height[node] < n:
+                activate(node)
+
+    # Flood all edges out of the source
+    for edge in adjacency[source]:
+        path_flow = capacities[edge]
+        capacities[edge] -= path_flow
+        capacities[edge ^ 1] += path_flow
+        excess[heads[edge]] += path_flow
+
+    global_relabel()
+    # Recompute heights after about every n relabels
+    relabels_since_global = 0
+
+    while True:
+        if highest_label:
+            while highest[0] > 0 and not buckets[highest[0]]:
+                highest[0] -= 1
+            if not buckets[highest[0]]:
+                break
+            node = buckets[highest[0]].pop()
+        else:
+            if not queue:
+                break
+            node = queue.popleft()
+
+        # Lifted by the gap heuristic or a global relabel since it was queued
+        if height[node] >= n or excess[node] == 0:
+            continue
+
+        # Discharge 'node'
+        edges = adjacency[node]
+        while excess[node] > 0:
+            i = next_arc[node]
+
+            if i == len(edges):
+                # Relabel - lift 'node' just above its lowest neighbour
+                old_height = height[node]
+                new_height = n
+                for edge in edges:
+                    if capacities[edge] > 0:
+                        new_height = min(new_height, height[heads[edge]] + 1)
+
+                height_count[old_height] -= 1
+                new_height = min(new_height, n)
+                height[node] = new_height
+                height_count[new_height] += 1
+                next_arc[node] = 0
+                relabels_since_global += 1
+
+                # Gap - nothing can reach the sink through 'old_height' now
+                if height_count[old_height] == 0:
+                    for other in range(n):
+                        if old_height < height[other] < n:
+                            height_count[height[other]] -= 1
+                            height[other] = n
+                            height_count[n] += 1
+
+                if height[node] >= n:
+                    break
+                continue
+
+            edge = edges[i]
+            neighbour = heads[edge]
+
+            if capacities[edge] > 0 and height[node] == height[neighbour] + 1:
+                # Push
+                path_flow = min(excess[node], capacities[edge])
+                capacities[edge] -= path_flow
+                capacities[edge ^ 1] += path_flow
+                excess[node] -= path_flow
+
+                if (excess[neighbour] == 0 and neighbour != sink
+                        and neighbour != source):
+                    excess[neighbour] += path_flow
+                    activate(neighbour)
+                else:
+                    excess[neighbour] += path_flow
+            else:
+                next_arc[node] += 1
+
+        if relabels_since_global >= n:
+            relabels_since_global = 0
+            global_relabel()
+
+    return excess[sink]
+
+def fifo_push_relabel(graph, source, sink): # type: (ResidualGraph, int, int) -> int
+    return push_relabel(graph, source, sink, highest_label=False)
+
+def highest_label_push_relabel(graph, source, sink):
+    # type: (ResidualGraph, int, int) -> int
+    return push_relabel(graph, source, sink, highest_label=True)
+
+MAX_FLOW_ALGORITHMS = {
+    'edmonds-karp': edmonds_karp,
+    'dinic': dinic,
+    'fifo-push-relabel': fifo_push_relabel,
+    'highest-label-push-relabel': highest_label_push_relabel
+}
+
+'''
+    Rough rules of thumb for picking an algorithm, from timing them on random
+    stations:
+        - Dinic's algorithm does best on dense graphs, where each level graph
+          holds many shortest paths that are all saturated in one phase
+        - Dinic's algorithm is also O(m sqrt(n)) on graphs where every
+          capacity is 1 ("unit networks")
+        - Otherwise, on sparse graphs FIFO push-relabel does the least work, as
+          it never has to search for whole paths
+        - Edmonds-Karp is never faster than the others, but it is kept as the
+          simplest reference implementation
+'''
+# graph: the corridors only, before add_supersource_and_supersink() - its
+#        edges would make every station look denser, and their capacities
+#        are the sum of several corridors'
+def choose_algorithm(graph): # type: (ResidualGraph) -> str
+    n = graph.num_nodes
+    # Every other edge is a reverse edge
+    num_edges = len(graph.heads) // 2
+
+    if n > 1 and num_edges >= 0.25 * n * (n - 1):
+        return 'dinic'
+
+    if max(graph.capacities[::2] or [0]) == 1:
+        return 'dinic'
+
+    return 'fifo-push-relabel'
+
+# algorithm: a key of MAX_FLOW_ALGORITHMS, or 'auto' to let
+# choose_algorithm() pick one
+# Modifies 'graph'!
+def find_max_flow(graph, entrances, exits, algorithm='auto'):
+    # type: (ResidualGraph, list[int], list[int], str) -> int
+    if algorithm == 'auto':
+        algorithm = choose_algorithm(graph)
+    if algorithm not in MAX_FLOW_ALGORITHMS:
+        raise ValueError('Unknown max flow algorithm: ' + algorithm)
+
+    source, sink = add_supersource_and_supersink(entrances, exits, graph)
+    return MAX_FLOW_ALGORITHMS[algorithm](graph, source, sink)
+
+def solution(entrances, exits, path, algorithm='auto'):
+    # type: (list[int], list[int], list[list[int]], str) -> int
+    return find_max_flow(graph_from_matrix(path), entrances, exits, algorithm)
+
+
+'''
+    Re-solving after small changes
+
+    After the max flow has been found, the residual graph still holds a valid
+    flow. If a single corridor changes, most of that flow is still valid, so
+    it is a waste to start again from zero flow:
+        - Capacity increased (or a corridor/entrance/exit added): the old flow
+          is still valid, so just search for new augmenting paths
+        - Capacity decreased below the flow through corridor u -> v: u is left
+          with too much flow coming in, and v with too little. First try to
+          send the difference from u to v along other corridors, which keeps
+          the total flow the same. Whatever can't be rerouted is cancelled by
+          sending it from u back to the supersource, and from the supersink
+          back to v, along the reverse edges. Then search for new augmenting
+          paths, as the rerouting may have opened some up.
+'''
+class FlowNetwork(object):
+    '''
+        Residual graph of a station that keeps its max flow up to date as
+        corridors, entrances and exits change.
+
+        The current max flow is in 'max_flow'.
+    '''
+
+    def __init__(self, entrances, exits, path):
+        # type: (list[int], list[int], list[list[int]]) -> None
+        self.graph = graph_from_matrix(path)
+        # (room, room) -> forward edge, to look up corridors by their rooms
+        self.corridors = {} # type: dict[tuple[int, int], int]
+        # room -> total capacity of the corridors leaving/entering it, the
+        # capacity of the room's supersource/supersink edge
+        self.outgoing = [0] * self.graph.num_nodes
+        self.incoming = [0] * self.graph.num_nodes
+
+        for edge in range(0, len(self.graph.heads), 2):
+            source = self.graph.heads[edge ^ 1]
+            target = self.graph.heads[edge]
+            self.corridors[(source, target)] = edge
+            self.outgoing[source] += self.graph.capacities[edge]
+            self.incoming[target] += self.graph.capacities[edge]
+
+        self.supersource = self.graph.add_node()
+        self.supersink = self.graph.add_node()
+        # room -> edge from the supersource/to the supersink
+        self.entrance_edges = {} # type: dict[int, int]
+        self.exit_edges = {} # type: dict[int, int]
+
+        for room in set(entrances):
+            self.entrance_edges[room] = self.graph.add_edge(
+                self.supersource, room, self.outgoing[room])
+        for room in set(exits):
+            self.exit_edges[room] = self.graph.add_edge(
+                room, self.supersink, self.incoming[room])
+
+        self.max_flow = dinic(self.graph, self.supersource, self.supersink)
+
+    def set_capacity(self, source, target, capacity):
+        # type: (int, int, int) -> int
+        edge = self.corridors.get((source, target))
+        if edge is None:
+            if capacity == 0:
+                return self.max_flow
+            edge = self.graph.add_edge(source, target, 0)
+            self.corridors[(source, target)] = edge
+
+        difference = capacity - self._capacity(edge)
+        self._set_edge_capacity(edge, capacity)
+
+        self.outgoing[source] += difference
+        self.incoming[target] += difference
+        # The bounds on the supersource/supersink edges follow the corridors
+        if source in self.entrance_edges:
+            self._set_edge_capacity(self.entrance_edges[source],
+                                    self.outgoing[source])
+        if target in self.exit_edges:
+            self._set_edge_capacity(self.exit_edges[target],
+                                    self.incoming[target])
+
+        return self._augment()
+
+    def add_entrance(self, room): # type: (int) -> int
+        if room not in self.entrance_edges:
+            self.entrance_edges[room] = self.graph.add_edge(
+                self.supersource, room, self.outgoing[room])
+
+        return self._augment()
+
+    def add_exit(self, room): # type: (int) -> int
+        if room not in self.exit_edges:
+            self.exit_edges[room] = self.graph.add_edge(
+                room, self.supersink, self.incoming[room])
+
+        return self._augment()
+
+    # The flow through an edge is the residual capacity of its reverse edge
+    def _capacity(self, edge): # type: (int) -> int
+        return self.graph.capacities[edge] + self.graph.capacities[edge ^ 1]
+
+    def _set_edge_capacity(self, edge, capacity): # type: (int, int) -> None
+        capacities = self.graph.capacities
+        flow = capacities[edge ^ 1]
+
+        if capacity >= flow:
+            capacities[edge] = capacity - flow
+            return
+
+        # Too much flow through 'edge' - take the extra flow off it, then
+        # repair the flow around it
+        overflow = flow - capacity
+        capacities[edge] = 0
+        capacities[edge ^ 1] = capacity
+
+        source = self.graph.heads[edge ^ 1]
+        target = self.graph.heads[edge]
+
+        overflow -= edmonds_karp(self.graph, source, target, overflow)
+
+        if overflow > 0:
+            if source != self.supersource:
+                edmonds_karp(self.graph, source, self.supersource, overflow)
+            if target != self.supersink:
+                edmonds_karp(self.graph, self.supersink, target, overflow)
+            self.max_flow -= overflow
+
+    def _augment(self): # type: () -> int
+        self.max_flow += dinic(self.graph, self.supersource, self.supersink)
+
+        return self.max_flow
 
 
 # ============================ Official test-cases ============================
@@ -204,3 +842,116 @@ assert solution([0, 1],
                  [0, 0, 0, 0, 6, 6],
                  [0, 0, 0, 0, 0, 0],
                  [0, 0, 0, 0, 0, 0]]) == 16, "solution(...) == 16 failed!"
+
+# =========== My own, unofficial test cases to help debug behaviour ===========
+# Same station as above, given as a sparse list of corridors
+graph = graph_from_edge_list(8,
+                             [(6, 0, 20), (6, 1, 20),
+                              (0, 2, 4), (0, 3, 6), (1, 2, 5), (1, 3, 2),
+                              (2, 4, 4), (2, 5, 4), (3, 4, 6), (3, 5, 6),
+                              (4, 7, 20), (5, 7, 20)])
+assert edmonds_karp(graph, 6, 7) == 16, "edmonds_karp(...) == 16 failed!"
+
+for algorithm in MAX_FLOW_ALGORITHMS:
+    assert solution([0, 1],
+                    [4, 5],
+                    [[0, 0, 4, 6, 0, 0],
+                     [0, 0, 5, 2, 0, 0],
+                     [0, 0, 0, 0, 4, 4],
+                     [0, 0, 0, 0, 6, 6],
+                     [0, 0, 0, 0, 0, 0],
+                     [0, 0, 0, 0, 0, 0]],
+                    algorithm) == 16, algorithm + " == 16 failed!"
+    assert solution([0],
+                    [3],
+                    [[0, 7, 0, 0],
+                     [0, 0, 6, 0],
+                     [0, 0, 0, 8],
+                     [9, 0, 0, 0]],
+                    algorithm) == 6, algorithm + " == 6 failed!"
+
+# The corridor matrix is left untouched
+path = [[0, 7, 0, 0],
+        [0, 0, 6, 0],
+        [0, 0, 0, 8],
+        [9, 0, 0, 0]]
+assert solution([0, 0], [3], path) == 6, "solution(...) == 6 failed!"
+assert path == [[0, 7, 0, 0],
+                [0, 0, 6, 0],
+                [0, 0, 0, 8],
+                [9, 0, 0, 0]], "solution(...) modified 'path'!"
+
+network = FlowNetwork([0, 1],
+                      [4, 5],
+                      [[0, 0, 4, 6, 0, 0],
+                       [0, 0, 5, 2, 0, 0],
+                       [0, 0, 0, 0, 4, 4],
+                       [0, 0, 0, 0, 6, 6],
+                       [0, 0, 0, 0, 0, 0],
+                       [0, 0, 0, 0, 0, 0]])
+assert network.max_flow == 16, "FlowNetwork(...).max_flow == 16 failed!"
+# Close the corridor 2 -> 4
+assert network.set_capacity(2, 4, 0) == 12, "set_capacity(2, 4, 0) failed!"
+# Widen corridor 2 -> 5
+assert network.set_capacity(2, 5, 9) == 17, "set_capacity(2, 5, 9) failed!"
+# New corridor 1 -> 4
+assert network.set_capacity(1, 4, 3) == 20, "set_capacity(1, 4, 3) failed!"
+# Room 3 becomes a new exit
+network.set_capacity(0, 3, 20)
+assert network.add_exit(3) == 34, "add_exit(3) failed!"
+
+# Same station as the official test-case, in each of the file formats
+station = [[0, 0, 4, 6, 0, 0],
+           [0, 0, 5, 2, 0, 0],
+           [0, 0, 0, 0, 4, 4],
+           [0, 0, 0, 0, 6, 6],
+           [0, 0, 0, 0, 0, 0],
+           [0, 0, 0, 0, 0, 0]]
+corridors = [(i, j, c) for i, row in enumerate(station)
+                       for j, c in enumerate(row) if c > 0]
+
+lines = ['# source target capacity', '']
+lines += ['%d %d %d' % corridor for corridor in corridors]
+graph = graph_from_edge_list(6, read_edge_list_text(lines))
+assert find_max_flow(graph, [0, 1], [4, 5]) == 16, "text edge list failed!"
+
+records = b''.join(struct.pack('<iii', *corridor) for corridor in corridors)
+graph = graph_from_edge_list(6, read_edge_list_binary(BytesIO(records)))
+assert find_max_flow(graph, [0, 1], [4, 5]) == 16, "binary edge list failed!"
+
+# Streams that return fewer bytes than asked for split records between reads
+class TrickleStream(object):
+    def __init__(self, data, read_size): # type: (bytes, int) -> None
+        self.stream = BytesIO(data)
+        self.read_size = read_size
+
+    def read(self, size): # type: (int) -> bytes
+        return self.stream.read(min(size, self.read_size))
+
+graph = graph_from_edge_list(6, read_edge_list_binary(TrickleStream(records, 5)))
+assert find_max_flow(graph, [0, 1], [4, 5]) == 16, "trickled edge list failed!"
+try:
+    list(read_edge_list_binary(TrickleStream(records[:-1], 5)))
+    assert False, "truncated edge list should fail!"
+except ValueError:
+    pass
+
+matrix = b''.join(struct.pack('<6q', *row) for row in station)
+graph = graph_from_matrix_buffer(matrix, 6, '<q')
+assert find_max_flow(graph, [0, 1], [4, 5]) == 16, "binary matrix failed!"
+
+# A sparse station where every corridor has capacity 1 is a unit network,
+# even though the entrance's virtual edge has capacity 2
+station = [[0, 1, 1, 0, 0, 0, 0, 0],
+           [0, 0, 0, 1, 0, 0, 0, 0],
+           [0, 0, 0, 0, 1, 0, 0, 0],
+           [0, 0, 0, 0, 0, 1, 0, 0],
+           [0, 0, 0, 0, 0, 0, 1, 0],
+           [0, 0, 0, 0, 0, 0, 0, 1],
+           [0, 0, 0, 0, 0, 0, 0, 1],
+           [0, 0, 0, 0, 0, 0, 0, 0]]
+graph = graph_from_matrix(station)
+assert choose_algorithm(graph) == 'dinic', "choose_algorithm(...) failed!"
+add_supersource_and_supersink([0], [7], graph)
+assert max(graph.capacities[::2]) == 2, "add_supersource_and_supersink(...) failed!"
+assert solution([0], [7], station) == 2, "solution(unit station) failed!"
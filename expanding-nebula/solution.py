@@ -1,7 +1,20 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
 # UTF-8 for the mathematical symbols in comments
-from collections import defaultdict
+from array import array
+import binascii
+from bisect import bisect_left
+from collections import OrderedDict
+from operator import add, mul
+import os
+import struct
+
+# Not available in the Foobar sandbox - used for the int64 transfer matrix
+# products, and for views onto memory-mapped transition matrices
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 '''
     I'm not sure if there's an intelligent way to backtrack through time,
@@ -42,17 +55,23 @@ from collections import defaultdict
     Ideas/Questions:
         - It may be more efficient to go down the shorter dimension though, as
           we know it will have a maximum of 9 rows.
+            - solution() now always sweeps along the longer dimension
 
         - This may help narrow down possible states earlier than going across
           the rows, which can be up to 50.
 
         - Could using a bitmap representation help?
+            - Yes! See evolve_column() and create_possible_column_pairs()
 
         - The readme calculates the possibilities using horizontal and vertical
           reflections - is this always true? Could we use it to save
           time/memory?
             - Maybe it is true, but isn't practical as you will get the
               reflections on the bruteforce pass anyway
+            - Flipping upside down is useful when every column is a
+              palindrome: then a preimage column and its reverse always have
+              the same count, so only one needs to be kept. See
+              count_preimages_by_symmetry()
 
     The plan:
       1. Generate all permutations of the first column, save the columns as
@@ -66,7 +85,7 @@ from collections import defaultdict
 '''
 
 def transpose(m): # type: (list[list[int]]) -> list[list[int]]
-    return map(list, zip(*m))
+    return list(map(list, zip(*m)))
 
 # Can take list[bool] or list[0 | 1]
 # col: list[0 | 1]
@@ -79,119 +98,1027 @@ def column_to_int(col): # type: (list[bool]) -> int
 
     return result
 
-POSSIBLE_PREIMAGES = {
-    True: [
-        [[1, 0],
-         [0, 0]],
-        [[0, 1],
-         [0, 0]],
-        [[0, 0],
-         [1, 0]],
-        [[0, 0],
-         [0, 1]]
-    ],
-    False: [
-        [[0, 0],
-         [0, 0]],
-        [[1, 1],
-         [0, 0]],
-        [[1, 0],
-         [1, 0]],
-        [[1, 0],
-         [0, 1]],
-        [[0, 1],
-         [1, 0]],
-        [[0, 1],
-         [0, 1]],
-        [[0, 0],
-         [1, 1]],
-        [[0, 1],
-         [1, 1]],
-        [[1, 0],
-         [1, 1]],
-        [[1, 1],
-         [0, 1]],
-        [[1, 1],
-         [1, 0]],
-        [[1, 1],
-         [1, 1]]
-    ]
-}
-
-# Input: bitmap-encoded column
-# Output: column, previous column state -> next neighbour column of previous column state
+'''
+    Bitmap representation
+
+    A preimage column of a gas column of height h has h + 1 cells. With the
+    preimage columns to the left (L) and right (R) of a gas column encoded as
+    bitmaps, the four cells of the 2x2 block for row i are bit i and bit i + 1
+    of L and R. Shifting down by one lines bit i + 1 up with bit i, so every
+    row of the gas column can be worked out at once:
+        a = L, b = L >> 1, c = R, d = R >> 1
+    Exactly one of a, b, c, d is set when exactly one of the pairs (a, b) and
+    (c, d) has an odd number of bits set, and neither pair has both set:
+        gas = ((a ^ b) ^ (c ^ d)) & ~(a & b) & ~(c & d)
+'''
+def evolve_column(left, right, height): # type: (int, int, int) -> int
+    mask = (1 << height) - 1
+    a, b, c, d = left, left >> 1, right, right >> 1
+
+    return ((a ^ b) ^ (c ^ d)) & ~(a & b) & ~(c & d) & mask
+
+# Input: bitmap-encoded column, and its height
+# Output: every (left, right) pair of preimage columns of the column, each
+#         packed into one int as left | (right << (height + 1))
 # The columns are encoded as a bitmap representation, contained inside an int
 # i.e. column .0.. -> 0b0100 = 4
-def create_possible_column_pairs(column): # type: (list[int]) -> dict[tuple[int, int], list[int]]
-    # A 'column pair' is a pair of columns, the left one being the source
-    # column, and the right one being the possible right-side neighbour column
-    possible_column_pairs = []
-
-    for i, gas in enumerate(column):
-        new_cols = []
-        # Consider rewriting to use bitwise operations instead
-        # Might be harder to understand though
-        if i == 0:
-            new_cols = POSSIBLE_PREIMAGES[gas]
-        else:
-            for pcp in possible_column_pairs:
-                for p in POSSIBLE_PREIMAGES[gas]:
-                    if pcp[-1] == p[0]:
-                        new_cols.append(pcp + [ p[1] ])
+#
+# Rather than trying every left and right preimage column, they are built up
+# one row at a time - each row adds bit i + 1 to both preimage columns, and
+# only the choices that give the right gas for row i are kept. This only ever
+# looks at pairs that are still valid for the rows so far.
+def generate_column_pairs(column, height): # type: (int, int) -> list[int]
+    # Number of bits in a preimage column, i.e. where 'right' starts
+    width = height + 1
+
+    # Bits 0 and 1 of (left, right) for row 0
+    possible_column_pairs = [
+        left | (right << width) for left in range(4) for right in range(4)
+        if evolve_column(left, right, 1) == column & 1]
+
+    for i in range(1, height):
+        gas = (column >> i) & 1
 
-        possible_column_pairs = new_cols
+        # The bits to add, for each number of cells already chosen for this
+        # row's 2x2 block (bit i of left and right, from row i - 1)
+        new_bits = [[(new_left << (i + 1)) | (new_right << (width + i + 1))
+                     for new_left in (0, 1) for new_right in (0, 1)
+                     if (num_chosen + new_left + new_right == 1) == gas]
+                    for num_chosen in range(3)]
 
-    list_of_possible_column_pairs = []
+        possible_column_pairs = [
+            pair | bits for pair in possible_column_pairs
+            for bits in new_bits[((pair >> i) & 1) + ((pair >> (width + i)) & 1)]]
 
-    for col_pair in possible_column_pairs:
-        list_of_possible_column_pairs.append(
-            list(map(column_to_int, transpose(col_pair))))
+    return possible_column_pairs
 
+# Input: bitmap-encoded column, and its height
+# Output: column, previous column state -> next neighbour column of previous column state
+def create_possible_column_pairs(column, height):
+    # type: (int, int) -> dict[tuple[int, int], list[int]]
     # Now we have a list of all possible previous columns (shape: n + 1, 2)
     # Encode the data into a map
     # (postimage column, preimage left column) -> preimage right column
+    mask = (1 << (height + 1)) - 1
     possible_columns_encoded_map = {}
-    for pair in list_of_possible_column_pairs:
-        key = (column_to_int(column), pair[0])
-        value = pair[1]
+    for pair in generate_column_pairs(column, height):
+        key = (column, pair & mask)
+        right = pair >> (height + 1)
 
         if key in possible_columns_encoded_map:
-            possible_columns_encoded_map[key].append(value)
+            possible_columns_encoded_map[key].append(right)
         else:
-            possible_columns_encoded_map[key] = [value]
+            possible_columns_encoded_map[key] = [right]
 
     return possible_columns_encoded_map
 
 
-def solution(g): # type: (list[list[bool]]) -> int
+'''
+    Transfer matrices
+
+    The counting is really a matrix-vector product for each column:
+        counts'[right] = sum of counts[left] for every valid (left, right)
+    where the "transfer matrix" of a gas column is 1 for valid (left, right)
+    pairs of its preimage columns, and 0 otherwise.
+
+    Most of the matrix is 0, so it's stored as a sparse matrix in "compressed
+    sparse row" (CSR) form, with the rows being the right columns:
+        lefts[offsets[right]:offsets[right + 1]]
+    are all the left columns that can be next to 'right'. The counts are a
+    flat list indexed by preimage column, so each column is one sparse
+    matrix-vector product - a sum() over a slice for each right column.
+
+    With NumPy the product is a gather (counts[lefts]) and a segmented sum
+    (add.reduceat), but NumPy only has fixed-width integers, so it's only used
+    when the sums can't overflow 64 bits - when counting modulo some number
+    that's small enough, or when the grid is small enough that even the exact
+    count can't get that big (see fits_in_int64()). Otherwise the exact count
+    can grow far past 64 bits, so it's done with Python's arbitrary-precision
+    ints.
+'''
+def create_transition_matrix(column, height):
+    # type: (int, int) -> tuple[array, array]
+    num_states = 1 << (height + 1)
+    # 'right' is in the high bits, so this sorts by right column first
+    pairs = sorted(generate_column_pairs(column, height))
+
+    lefts = array('l', [pair & (num_states - 1) for pair in pairs])
+    # The pairs for right column r start at the first pair >= r << (height + 1)
+    offsets = array('l', [bisect_left(pairs, right << (height + 1))
+                          for right in range(num_states + 1)])
+
+    return offsets, lefts
+
+'''
+    Caching transition matrices
+
+    A transition matrix only depends on the column bitmap and its height, not
+    on the rest of the grid, so they can be shared between grids - most useful
+    when processing lots of grids of the same height.
+
+    The cache is process-wide, and keeps the most recently used matrices up to
+    'max_size' of them (a "least recently used" cache).
+
+    If 'directory' is set, every matrix that is built is also saved there, and
+    matrices that are missing from memory are looked for there first. So new
+    processes can start with the matrices of earlier ones, rather than
+    building them all again. The files are memory-mapped, so they are only
+    read in from disk as they are used, and only when they are first needed.
+    They are in the machine's native byte order, so aren't meant to be moved
+    between machines.
+'''
+class TransitionCache(object):
+    def __init__(self, max_size=1024, directory=None):
+        # type: (int, str | None) -> None
+        self.max_size = max_size
+        self.directory = directory
+        # (height, column) -> (offsets, lefts), least recently used first
+        self.matrices = OrderedDict()
+
+    def get(self, column, height): # type: (int, int) -> tuple[array, array]
+        key = (height, column)
+
+        if key in self.matrices:
+            # Move to the end, as the most recently used
+            matrix = self.matrices.pop(key)
+        else:
+            matrix = self.load(column, height)
+            if matrix is None:
+                matrix = create_transition_matrix(column, height)
+                self.save(column, height, matrix)
+
+        self.matrices[key] = matrix
+        while len(self.matrices) > self.max_size:
+            self.matrices.popitem(last=False)
+
+        return matrix
+
+    def clear(self): # type: () -> None
+        self.matrices.clear()
+
+    # Whether get() can return the matrix without building it
+    def is_cached(self, column, height): # type: (int, int) -> bool
+        return (height, column) in self.matrices or (
+            self.directory is not None
+            and os.path.exists(self.path(column, height)))
+
+    def path(self, column, height): # type: (int, int) -> str
+        return os.path.join(self.directory,
+                            'transitions-%d-%d.bin' % (height, column))
+
+    # File format: the lengths of 'offsets' and 'lefts' as two native longs,
+    # followed by the two arrays
+    def load(self, column, height):
+        # type: (int, int) -> tuple[array, array] | None
+        if self.directory is None or not os.path.exists(self.path(column, height)):
+            return None
+
+        # Imported here as the Foobar sandbox doesn't allow mmap
+        import mmap
+
+        with open(self.path(column, height), 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_size = struct.calcsize('=2l')
+        num_offsets, num_lefts = struct.unpack_from('=2l', data, 0)
+        item_size = array('l').itemsize
+        lefts_start = header_size + num_offsets * item_size
+
+        if numpy is not None:
+            # Views onto the memory map, which pages the file in lazily
+            offsets = numpy.frombuffer(data, dtype=numpy.int_,
+                                       count=num_offsets, offset=header_size)
+            lefts = numpy.frombuffer(data, dtype=numpy.int_,
+                                     count=num_lefts, offset=lefts_start)
+            return offsets, lefts
+
+        offsets = array('l')
+        lefts = array('l')
+        for values, start, length in ((offsets, header_size, num_offsets),
+                                      (lefts, lefts_start, num_lefts)):
+            chunk = data[start:start + length * item_size]
+            # Python 2's array has fromstring(), Python 3's has frombytes()
+            if hasattr(values, 'frombytes'):
+                values.frombytes(chunk)
+            else:
+                values.fromstring(chunk)
+        data.close()
+
+        return offsets, lefts
+
+    def save(self, column, height, matrix):
+        # type: (int, int, tuple[array, array]) -> None
+        if self.directory is None:
+            return
+
+        offsets, lefts = matrix
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # Write to a temporary file first, so other processes never see a
+        # half-written file
+        path = self.path(column, height)
+        temporary_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary_path, 'wb') as f:
+            f.write(struct.pack('=2l', len(offsets), len(lefts)))
+            f.write(offsets)
+            f.write(lefts)
+        os.rename(temporary_path, path)
+
+TRANSITION_CACHE = TransitionCache()
+
+def multiply_transition_matrix(matrix, counts, modulus=None):
+    # type: (tuple[array, array], list[int], int | None) -> list[int]
+    offsets, lefts = matrix
+    get_count = counts.__getitem__
+
+    next_counts = [sum(map(get_count, lefts[offsets[right]:offsets[right + 1]]))
+                   for right in range(len(offsets) - 1)]
+
+    if modulus is not None:
+        next_counts = [count % modulus for count in next_counts]
+
+    return next_counts
+
+# matrix: (offsets, lefts) as NumPy arrays
+# counts: a count vector, or rows of count vectors - the last axis is always
+#         the preimage column
+def multiply_transition_matrix_numpy(matrix, counts, modulus=None):
+    # type: (tuple[numpy.ndarray, numpy.ndarray], numpy.ndarray, int | None) -> numpy.ndarray
+    offsets, lefts = matrix
+    # reduceat() needs a valid index for every segment, even empty ones at the
+    # end, and gives the element at the start of empty segments - so pad with
+    # a 0, then zero out the empty segments
+    padding = numpy.zeros(counts.shape[:-1] + (1,), dtype=counts.dtype)
+    gathered = numpy.concatenate((counts[..., lefts], padding), axis=-1)
+    next_counts = numpy.add.reduceat(gathered, offsets[:-1], axis=-1)
+    next_counts[..., offsets[:-1] == offsets[1:]] = 0
+
+    return next_counts % modulus if modulus is not None else next_counts
+
+# Whether the counts can be kept in int64 without overflowing
+def fits_in_int64(encoded_columns, height, modulus=None):
+    # type: (list[int], int, int | None) -> bool
+    # Every state gets at most 2^(h + 1) counts added together
+    if modulus is not None:
+        return (modulus - 1) * (1 << (height + 1)) < 1 << 63
+
+    # Every count is at most the number of ways to fill in the preimage so
+    # far, and even the total is at most 2^((h + 1) × (w + 1))
+    return (height + 1) * (len(encoded_columns) + 1) < 63
+
+'''
+    Sweeping down a column one row at a time
+
+    The transfer matrix of a column has up to 4^(h + 1) entries, which gets
+    too big to build for tall grids (millions of pairs for h = 12). But it
+    doesn't need to be built at all: the preimage pair can be chosen one row
+    at a time, just like generate_column_pairs() does, while carrying the
+    counts along with it.
+
+    Before row i, the state is every cell of the left column L that is still
+    needed (rows i to h), and the cells of the right column R chosen so far
+    (rows 0 to i). Row i looks at L_i, L_i+1 and R_i, chooses R_i+1, and then
+    L_i is never needed again, so it's summed out. The state is always h + 2
+    bits, packed into the index of a flat list, with:
+        bit h + 1:          L_i
+        bit h:              R_i
+        bits h - 1 .. 0:    L_i+1, L_i+2, ..., L_h, R_0, ..., R_i-1
+    Keeping the cells of row i in the top bits means each combination of
+    (L_i, R_i, L_i+1) is a contiguous slice of the list, and the new state
+    just shifts the rest up a bit with R_i at the bottom - an interleave, which
+    is a slice assignment with a step of 2. So each row is a handful of
+    slice copies and element-wise additions done inside the interpreter's C
+    code, with no per-state Python loop at all.
+
+    For (b, c) = (L_i+1, R_i), which (L_i, R_i+1) give the right gas for row i:
+        | gas | b + c |          valid (L_i, R_i+1)          |
+        |:---:|:-----:|:------------------------------------:|
+        |  1  |   0   | (1, 0), (0, 1)                       |
+        |  1  |   1   | (0, 0)                               |
+        |  1  |   2   | none                                 |
+        |  0  |   0   | (0, 0), (1, 1)                       |
+        |  0  |   1   | (1, 0), (0, 1), (1, 1)               |
+        |  0  |   2   | (0, 0), (1, 0), (0, 1), (1, 1)       |
+
+    Between columns, the counts are indexed by the preimage column with its
+    bits reversed (row 0 in the highest bit), as that's the order they come
+    out of the sweep in.
+'''
+# counts: indexed by bit-reversed left preimage column
+# Output: counts indexed by bit-reversed right preimage column
+def sweep_column(counts, column, height, modulus=None):
+    # type: (list[int], int, int, int | None) -> list[int]
+    half = 1 << (height - 1)
+    block = 1 << height
+
+    # Start of the sweep: bit h + 1 is L_0, bits h - 1 .. 0 are L_1 .. L_h and
+    # R_0 (bit h) can be anything
+    state = counts[:block] * 2 + counts[block:] * 2
+
+    for i in range(height):
+        gas = (column >> i) & 1
+        new_state = [0] * (4 * block)
+
+        for b in (0, 1):
+            for c in (0, 1):
+                # Counts for L_i = 0 and L_i = 1
+                start = ((c << 1) | b) * half
+                x0 = state[start:start + half]
+                x1 = state[4 * half + start:4 * half + start + half]
+
+                # Counts for R_i+1 = 0 and R_i+1 = 1, None for nothing
+                if gas:
+                    if b + c == 0:
+                        y0, y1 = x1, x0
+                    elif b + c == 1:
+                        y0, y1 = x0, None
+                    else:
+                        y0, y1 = None, None
+                else:
+                    if b + c == 0:
+                        y0, y1 = x0, x1
+                    elif b + c == 1:
+                        y0, y1 = x1, list(map(add, x0, x1))
+                    else:
+                        y0 = y1 = list(map(add, x0, x1))
+
+                # New state: L_i+1 = b on top, then R_i+1, then the rest of
+                # the old state with R_i = c added at the bottom
+                for r, y in ((0, y0), (1, y1)):
+                    if y is not None:
+                        new_start = ((b << 1) | r) * block + c
+                        new_state[new_start:new_start + block:2] = y
+
+        state = new_state
+
+    # End of the sweep: bit h + 1 is L_h, which is summed out, bit h is R_h
+    # and bits h - 1 .. 0 are R_0 .. R_h-1
+    summed = list(map(add, state[:2 * block], state[2 * block:]))
+    next_counts = [0] * (2 * block)
+    next_counts[0::2] = summed[:block]
+    next_counts[1::2] = summed[block:]
+
+    if modulus is not None:
+        next_counts = [count % modulus for count in next_counts]
+
+    return next_counts
+
+def count_preimages_by_rows(encoded_columns, height, modulus=None):
+    # type: (list[int], int, int | None) -> int
+    counts = [1] * (1 << (height + 1))
+    for column in encoded_columns:
+        counts = sweep_column(counts, column, height, modulus)
+
+    total = sum(counts)
+    return total % modulus if modulus is not None else total
+
+'''
+    Products of transfer matrices
+
+    Each column is a linear map on the count vector (its transfer matrix), and
+    matrix products are associative, so the product of several columns can
+    be worked out on its own, and then used in place of them.
+
+    segment_transfer_matrix() builds the product one row at a time, by
+    sweeping a count vector with a single 1 in it through the columns - row l
+    is how many ways there are to get from left preimage column l to each
+    right preimage column. That's 2^(h + 1) sweeps, so it's only worth it
+    when the product gets used many times over.
+'''
+# Output: the product of the segment's transfer matrices, as a list of rows
+#         with both the rows and columns indexed by bit-reversed preimage
+#         column (like the count vectors of sweep_column())
+def segment_transfer_matrix(task):
+    # type: (tuple[list[int], int, int | None]) -> list[list[int]]
+    columns, height, modulus = task
+    num_states = 1 << (height + 1)
+
+    rows = []
+    for left in range(num_states):
+        counts = [0] * num_states
+        counts[left] = 1
+        for column in columns:
+            counts = sweep_column(counts, column, height, modulus)
+        rows.append(counts)
+
+    return rows
+
+# Input: count vector, and a product from segment_transfer_matrix() (or any
+#        product with rows and columns indexed the same way as the counts)
+# Output: counts'[right] = sum of counts[left] × product[left][right]
+def multiply_product(counts, product, modulus=None):
+    # type: (list[int], list[list[int]], int | None) -> list[int]
+    next_counts = [0] * len(counts)
+    for count, row in zip(counts, product):
+        if count:
+            next_counts = [total + count * entry
+                           for total, entry in zip(next_counts, row)]
+
+    if modulus is not None:
+        next_counts = [count % modulus for count in next_counts]
+
+    return next_counts
+
+'''
+    Repeated column patterns
+
+    When the grid is a short pattern of columns repeated over and over, the
+    product of the whole grid is just the pattern's product P raised to the
+    number of repetitions. So rather than sweeping through every column,
+    square P over and over (P, P^2, P^4, ...) and multiply the count vector by
+    the powers for the bits set in the number of repetitions - O(log r)
+    products for r repetitions.
+
+    Each product of two matrices is 2^(h + 1) times as much work as a count
+    vector times a matrix though, so this is only quicker for grids that are
+    very wide compared to 2^(h + 1). Modulo 10^9 + 7, a 4-column pattern
+    repeated 25000 times with h = 3 takes ~0.03s instead of ~2.8s, and a
+    3-column pattern repeated 25000 times with h = 6 ~0.27s instead of ~8.8s.
+
+    Building P alone is 2^(h + 1) sweeps of the pattern, and then there are
+    about log2(r) squarings, so count_preimages_by_period() only uses the
+    matrices when r > 2^(h + 1) × log2(r) / 2, roughly where they broke even
+    when timed (e.g. r ≈ 500 for h = 6). Otherwise, including when the
+    columns don't repeat at all, it just sweeps through every column.
+
+    find_period() finds the shortest pattern that the columns are repeats of
+    (with possibly a partial repeat at the end) using the prefix function
+    from the Knuth-Morris-Pratt string search: if the longest proper prefix
+    of the columns that is also a suffix has length k, they repeat with
+    period n - k.
+'''
+# Output: the product of two products from segment_transfer_matrix()
+def multiply_products(first, second, modulus=None):
+    # type: (list[list[int]], list[list[int]], int | None) -> list[list[int]]
+    return [multiply_product(row, second, modulus) for row in first]
+
+# Output: counts × product^exponent, by repeated squaring
+def multiply_product_power(counts, product, exponent, modulus=None):
+    # type: (list[int], list[list[int]], int, int | None) -> list[int]
+    power = product
+    while exponent:
+        if exponent & 1:
+            counts = multiply_product(counts, power, modulus)
+        exponent >>= 1
+        if exponent:
+            power = multiply_products(power, power, modulus)
+
+    return counts
+
+# Output: number of preimages of 'pattern' repeated 'repetitions' times,
+#         modulo 'modulus' if given
+def count_repeated_preimages(pattern, repetitions, height, modulus=None):
+    # type: (list[int], int, int, int | None) -> int
+    counts = [1] * (1 << (height + 1))
+    product = segment_transfer_matrix((pattern, height, modulus))
+    counts = multiply_product_power(counts, product, repetitions, modulus)
+
+    total = sum(counts)
+    return total % modulus if modulus is not None else total
+
+# Output: length of the shortest pattern that 'encoded_columns' repeats
+def find_period(encoded_columns): # type: (list[int]) -> int
+    # prefix[i]: length of the longest proper prefix of encoded_columns[:i + 1]
+    #            that is also a suffix of it
+    prefix = [0] * len(encoded_columns)
+    length = 0
+    for i in range(1, len(encoded_columns)):
+        while length and encoded_columns[i] != encoded_columns[length]:
+            length = prefix[length - 1]
+        if encoded_columns[i] == encoded_columns[length]:
+            length += 1
+        prefix[i] = length
+
+    return len(encoded_columns) - (prefix[-1] if encoded_columns else 0)
+
+# Input: bitmap-encoded columns of the gas grid, from left to right
+# Output: number of preimages of the grid, modulo 'modulus' if given
+def count_preimages_by_period(encoded_columns, height, modulus=None):
+    # type: (list[int], int, int | None) -> int
+    period = max(find_period(encoded_columns), 1)
+    repetitions, remainder = divmod(len(encoded_columns), period)
+    pattern = encoded_columns[:period]
+
+    # Not enough repeats to pay for building and squaring the product
+    if 2 * repetitions <= (1 << (height + 1)) * repetitions.bit_length():
+        return count_preimages_by_rows(encoded_columns, height, modulus)
+
+    counts = [1] * (1 << (height + 1))
+    product = segment_transfer_matrix((pattern, height, modulus))
+    counts = multiply_product_power(counts, product, repetitions, modulus)
+
+    # The partial repeat at the end
+    for column in pattern[:remainder]:
+        counts = sweep_column(counts, column, height, modulus)
+
+    total = sum(counts)
+    return total % modulus if modulus is not None else total
+
+# Input: bitmap-encoded columns of the gas grid, from left to right
+# Output: number of preimages of the grid, modulo 'modulus' if given
+def count_preimages_by_matrices(encoded_columns, height, modulus=None):
+    # type: (list[int], int, int | None) -> int
+    matrices = dict((column, TRANSITION_CACHE.get(column, height))
+                    for column in set(encoded_columns))
+
+    # Every possible preimage column can start the grid
+    counts = apply_transition_matrices(
+        matrices, encoded_columns, [1] * (1 << (height + 1)), height, modulus)
+
+    total = sum(counts)
+    return total % modulus if modulus is not None else total
+
+# Views an array('l') as an int64 NumPy array, without copying it if the
+# machine's longs are already 64 bits
+def as_int64_array(values): # type: (array | numpy.ndarray) -> numpy.ndarray
+    if not isinstance(values, numpy.ndarray) and values.itemsize == 8:
+        return numpy.frombuffer(values, dtype=numpy.int64)
+
+    return numpy.asarray(values, dtype=numpy.int64)
+
+# Input: column -> transition matrix, the columns to apply them for, and the
+#        starting counts
+# Output: the counts after every column
+def apply_transition_matrices(matrices, encoded_columns, counts, height,
+                              modulus=None):
+    # type: (dict[int, tuple[array, array]], list[int], list[int], int, int | None) -> list[int]
+    if numpy is not None and fits_in_int64(encoded_columns, height, modulus):
+        numpy_matrices = dict(
+            (column, (as_int64_array(offsets), as_int64_array(lefts)))
+            for column, (offsets, lefts) in matrices.items())
+
+        numpy_counts = numpy.array(counts, dtype=numpy.int64)
+        if modulus is not None:
+            numpy_counts %= modulus
+        for column in encoded_columns:
+            numpy_counts = multiply_transition_matrix_numpy(
+                numpy_matrices[column], numpy_counts, modulus)
+
+        return [int(count) for count in numpy_counts]
+
+    for column in encoded_columns:
+        counts = multiply_transition_matrix(matrices[column], counts, modulus)
+
+    return counts
+
+'''
+    Reflection symmetry
+
+    Flipping a grid upside down flips its preimages upside down too, so when
+    every gas column reads the same from the bottom up (a palindrome), the
+    upside down version of a preimage is another preimage of the same grid.
+    So the count for a preimage column is always the same as the count for
+    its reverse, and only one of them needs to be kept - the smaller one, the
+    "representative".
+
+    The folded transfer matrix has a row for each representative right
+    column, and lists the representatives of its left columns - a left column
+    and its reverse both add the same count, so the representative is just
+    listed twice. Since it's in the same format as the unfolded matrices, the
+    same multiply functions work on it. There are 2^h + 2^⌊h / 2⌋
+    representatives for 2^(h + 1) preimage columns, so this is roughly half
+    the states and half the work. At the end, representatives that aren't
+    their own reverse count twice. For 600 palindromic columns with h = 8,
+    exact counting takes ~0.15s folded, ~0.3s with the unfolded matrices and
+    ~0.2s sweeping down the rows.
+'''
+def reverse_bits(value, width): # type: (int, int) -> int
+    result = 0
+    for _ in range(width):
+        result = (result << 1) | (value & 1)
+        value >>= 1
+
+    return result
+
+def is_palindrome(column, height): # type: (int, int) -> bool
+    return reverse_bits(column, height) == column
+
+# Output: the representative preimage columns, the index of each preimage
+#         column's representative, and how many preimage columns each
+#         representative stands for
+def fold_states(height): # type: (int) -> tuple[list[int], list[int], list[int]]
+    width = height + 1
+    reverses = [reverse_bits(state, width) for state in range(1 << width)]
+
+    representatives = [state for state in range(1 << width)
+                       if state <= reverses[state]]
+    index = dict((state, i) for i, state in enumerate(representatives))
+    folded_index = [index[min(state, reverses[state])]
+                    for state in range(1 << width)]
+    multiplicities = [1 if state == reverses[state] else 2
+                      for state in representatives]
+
+    return representatives, folded_index, multiplicities
+
+def create_folded_transition_matrix(column, height, representatives,
+                                    folded_index):
+    # type: (int, int, list[int], list[int]) -> tuple[array, array]
+    offsets, lefts = TRANSITION_CACHE.get(column, height)
+
+    folded_offsets = array('l', [0])
+    folded_lefts = array('l')
+    for right in representatives:
+        folded_lefts.extend(folded_index[left]
+                            for left in lefts[offsets[right]:offsets[right + 1]])
+        folded_offsets.append(len(folded_lefts))
+
+    return folded_offsets, folded_lefts
+
+# Input: bitmap-encoded columns of the gas grid, which must all be palindromes
+# Output: number of preimages of the grid, modulo 'modulus' if given
+def count_preimages_by_symmetry(encoded_columns, height, modulus=None):
+    # type: (list[int], int, int | None) -> int
+    representatives, folded_index, multiplicities = fold_states(height)
+    matrices = dict(
+        (column, create_folded_transition_matrix(
+            column, height, representatives, folded_index))
+        for column in set(encoded_columns))
+
+    counts = apply_transition_matrices(
+        matrices, encoded_columns, [1] * len(representatives), height, modulus)
+
+    total = sum(map(mul, counts, multiplicities))
+    return total % modulus if modulus is not None else total
+
+'''
+    Counting in parallel
+
+    The columns can be split up into segments, the product of each segment
+    worked out in a separate process, and then the products multiplied
+    together in order. The first segment only needs the count vector, as
+    every left preimage column starts with a count of 1.
+
+    Each segment's product is built with NumPy, starting from the identity
+    matrix and applying each column's transfer matrix to every row at once -
+    the same gather and segmented sum as for a count vector, just on a
+    2^(h + 1) × 2^(h + 1) array. While that array is small, the step costs
+    about the same as a step on a count vector, as it's mostly NumPy's
+    per-call overhead, but it grows with 2^(h + 1) times the number of valid
+    pairs. Per column, modulo 10^9 + 7 (timed on one core):
+        | h | count vector | product | product / vector |
+        |:-:|:------------:|:-------:|:----------------:|
+        | 1 |    10.2µs    | 12.5µs  |       1.2        |
+        | 2 |    10.2µs    | 13.6µs  |       1.3        |
+        | 3 |    10.1µs    | 17.5µs  |       1.7        |
+        | 4 |    10.8µs    | 30.6µs  |       2.8        |
+        | 5 |    12.4µs    | 89.5µs  |       7.2        |
+        | 6 |    13.5µs    | 451µs   |       33         |
+    So with p cores the segments should take about (product / vector) / p of
+    the time of one count vector going through every column, e.g. ~0.43 for
+    h = 3 with 4 cores. That's a projection - the only machine this was timed
+    on has one core, where 200,000 random columns modulo 10^9 + 7 took:
+        | h | count_preimages() | workers = 2 | workers = 4 |
+        |:-:|:-----------------:|:-----------:|:-----------:|
+        | 2 |       1.71s       |    1.98s    |    2.18s    |
+        | 3 |       2.16s       |    2.68s    |    2.99s    |
+        | 4 |       1.89s       |    3.55s    |    4.99s    |
+    i.e. the total work, which is what the cores would have to share. Past MAX_PARALLEL_HEIGHT the products cost too much
+    for any normal number of cores, so count_preimages_in_parallel() counts
+    in this process instead - as it also does with one worker, without NumPy,
+    or when the counts might overflow int64 (see fits_in_int64()).
+
+    'workers = 0' works out every segment in this process, without a pool,
+    which is only useful for checking the segments add up.
+'''
+MAX_PARALLEL_HEIGHT = 4
+
+# Output: the product of the segment's transfer matrices, as a list of rows
+#         indexed by preimage column
+def segment_transfer_matrix_numpy(task):
+    # type: (tuple[list[int], int, int | None]) -> list[list[int]]
+    columns, height, modulus = task
+    matrices = dict(
+        (column, tuple(map(as_int64_array, TRANSITION_CACHE.get(column, height))))
+        for column in set(columns))
+
+    product = numpy.identity(1 << (height + 1), dtype=numpy.int64)
+    for column in columns:
+        product = multiply_transition_matrix_numpy(
+            matrices[column], product, modulus)
+
+    # Python ints, so multiplying the products together can't overflow
+    return product.tolist()
+
+# Input: bitmap-encoded columns of the gas grid, from left to right
+# Output: number of preimages of the grid, modulo 'modulus' if given
+def count_preimages_in_parallel(encoded_columns, height, modulus=None,
+                                workers=None, num_segments=None):
+    # type: (list[int], int, int | None, int | None, int | None) -> int
+    # Imported here as the Foobar sandbox doesn't allow multiprocessing
+    import multiprocessing
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if (workers == 1 or height > MAX_PARALLEL_HEIGHT or numpy is None
+            or not fits_in_int64(encoded_columns, height, modulus)):
+        return count_preimages(encoded_columns, height, modulus)
+
+    if num_segments is None:
+        num_segments = max(workers, 1)
+    num_segments = max(1, min(num_segments, len(encoded_columns)))
+
+    # Split into segments as even as possible
+    bounds = [len(encoded_columns) * i // num_segments
+              for i in range(num_segments + 1)]
+    tasks = [(encoded_columns[start:end], height, modulus)
+             for start, end in zip(bounds, bounds[1:])]
+
+    # Build the transition matrices before starting the pool, so forked
+    # workers start with them in TRANSITION_CACHE
+    matrices = dict((column, TRANSITION_CACHE.get(column, height))
+                    for column in set(encoded_columns))
+    first_columns = tasks[0][0]
+
+    if workers == 0:
+        counts = apply_transition_matrices(
+            matrices, first_columns, [1] * (1 << (height + 1)), height, modulus)
+        products = list(map(segment_transfer_matrix_numpy, tasks[1:]))
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = pool.map_async(segment_transfer_matrix_numpy, tasks[1:])
+            # The first segment only needs a count vector, do it while waiting
+            counts = apply_transition_matrices(
+                matrices, first_columns, [1] * (1 << (height + 1)), height,
+                modulus)
+            products = pending.get()
+        finally:
+            pool.close()
+            pool.join()
+
+    for product in products:
+        counts = multiply_product(counts, product, modulus)
+
+    total = sum(counts)
+    return total % modulus if modulus is not None else total
+
+# The transfer matrices are quicker to multiply than sweeping down a column,
+# but only with NumPy's int64, and they get too big to build past this height
+MAX_MATRIX_HEIGHT = 9
+# Without NumPy, the folded matrices are still quicker up to this height
+MAX_SYMMETRY_HEIGHT = 8
+# Building a transition matrix takes about as long as a few sweeps down the
+# column (timed at ~3 for h = 9, and more in a fresh process), so the
+# matrices only win when there are this many columns for each one that
+# still needs building
+MATRIX_BUILD_COST = 8
+
+def matrices_pay_off(encoded_columns, height): # type: (list[int], int) -> bool
+    num_uncached = sum(1 for column in set(encoded_columns)
+                       if not TRANSITION_CACHE.is_cached(column, height))
+    return len(encoded_columns) >= MATRIX_BUILD_COST * num_uncached
+
+# Input: bitmap-encoded columns of the gas grid, from left to right
+# Output: number of preimages of the grid, modulo 'modulus' if given
+def count_preimages(encoded_columns, height, modulus=None):
+    # type: (list[int], int, int | None) -> int
+    # Otherwise building the matrices takes longer than just sweeping
+    if not matrices_pay_off(encoded_columns, height):
+        return count_preimages_by_rows(encoded_columns, height, modulus)
+
+    symmetric = all(is_palindrome(column, height)
+                    for column in set(encoded_columns))
+    with_numpy = (numpy is not None
+                  and fits_in_int64(encoded_columns, height, modulus))
+
+    if symmetric and height <= (MAX_MATRIX_HEIGHT if with_numpy
+                                else MAX_SYMMETRY_HEIGHT):
+        return count_preimages_by_symmetry(encoded_columns, height, modulus)
+    if with_numpy and height <= MAX_MATRIX_HEIGHT:
+        return count_preimages_by_matrices(encoded_columns, height, modulus)
+
+    return count_preimages_by_rows(encoded_columns, height, modulus)
+
+'''
+    The number of states is 2^(h + 1) for a grid of height h, but is only
+    linear in the width, so go across the longer dimension. The rule is the
+    same when the grid is flipped along its diagonal (the 2x2 block of a cell
+    is the same 4 cells), so the preimages of the transposed grid are just
+    the transposes of the preimages of the grid, and there are as many of
+    them.
+'''
+# Output: number of preimages of the grid, modulo 'modulus' if given
+def solution(g, modulus=None): # type: (list[list[bool]], int | None) -> int
+    # Make the columns the shorter dimension
+    if len(g) > len(g[0]):
+        g = transpose(g)
+
     # This is the transpose i.e. a list of columns
     list_of_columns = transpose(g)
 
     encoded_columns = list(map(column_to_int, list_of_columns))
 
-    num_possibilities = 1 << ( len(g) + 1 )
-    # (column, previous column state) -> next neighbour column of previous column state
-    valid_possible_cols = defaultdict(set) # type: dict[int, set[list[int]]]
+    return count_preimages(encoded_columns, len(g), modulus)
 
-    # Construct the map
-    for column in list_of_columns:
-        pairs_map = create_possible_column_pairs(column)
+'''
+    Streaming columns
 
-        for k, v in pairs_map.items():
-            valid_possible_cols[k].update(v)
+    The count vector only ever depends on the columns so far, so the grid
+    doesn't need to be held in memory - PreimageCounter takes the columns one
+    at a time and keeps just the count vector. Without the whole grid it
+    can't swap the dimensions around, so the columns should be the shorter
+    dimension.
 
+    The state can be saved with to_bytes() and carried on from later with
+    from_bytes(). The format is a header of
+        height, number of columns so far, length of the modulus in bytes,
+        length of each count in bytes
+    as big-endian unsigned ints ('>HQII'), then the modulus (if there is one)
+    and then every count, each in that many big-endian bytes. Every count is
+    the same length, so that's only as big as the biggest count needs, e.g.
+    with a 32-bit modulus and h = 9 it's ~4kB.
+'''
+def int_to_bytes(value, length): # type: (int, int) -> bytes
+    return binascii.unhexlify('%0*x' % (2 * length, value)) if length else b''
 
-    counts = { i: 1 for i in range(num_possibilities) }
+def int_from_bytes(data): # type: (bytes) -> int
+    return int(binascii.hexlify(data), 16) if data else 0
 
-    for column in encoded_columns:
-        next_columns = defaultdict(int)
-        for preimage_col in range(num_possibilities): # for every possible preimage
-            for next_preimage_col in valid_possible_cols[(column, preimage_col)]: # every valid preimage for column
-                next_columns[next_preimage_col] += counts[preimage_col]
+class PreimageCounter(object):
+    HEADER_FORMAT = '>HQII'
+
+    def __init__(self, height, modulus=None): # type: (int, int | None) -> None
+        self.height = height
+        self.modulus = modulus
+        self.num_columns = 0
+        # Indexed by bit-reversed preimage column, see sweep_column()
+        self.counts = [1] * (1 << (height + 1))
+        if modulus is not None:
+            self.counts = [count % modulus for count in self.counts]
+
+    # bits: bitmap-encoded column, or the column as a list of bools
+    def push_column(self, bits): # type: (int | list[bool]) -> None
+        if isinstance(bits, (list, tuple)):
+            if len(bits) != self.height:
+                raise ValueError('Column has %d cells, expected %d'
+                                 % (len(bits), self.height))
+            bits = column_to_int(bits)
+        elif not 0 <= bits < 1 << self.height:
+            raise ValueError('Column %d has more than %d cells'
+                             % (bits, self.height))
+
+        self.counts[:] = sweep_column(self.counts, bits, self.height,
+                                      self.modulus)
+        self.num_columns += 1
+
+    def current_count(self): # type: () -> int
+        total = sum(self.counts)
+        return total % self.modulus if self.modulus is not None else total
+
+    def to_bytes(self): # type: () -> bytes
+        modulus = self.modulus if self.modulus is not None else 0
+        modulus_length = (modulus.bit_length() + 7) // 8
+        count_length = (max(self.counts).bit_length() + 7) // 8
+
+        return b''.join(
+            [struct.pack(self.HEADER_FORMAT, self.height, self.num_columns,
+                         modulus_length, count_length),
+             int_to_bytes(modulus, modulus_length)] +
+            [int_to_bytes(count, count_length) for count in self.counts])
+
+    @classmethod
+    def from_bytes(cls, data): # type: (bytes) -> PreimageCounter
+        header_size = struct.calcsize(cls.HEADER_FORMAT)
+        if len(data) < header_size:
+            raise ValueError('Truncated preimage counter header')
+
+        height, num_columns, modulus_length, count_length = struct.unpack_from(
+            cls.HEADER_FORMAT, data, 0)
+        start = header_size + modulus_length
+        num_states = 1 << (height + 1)
+        if len(data) != start + num_states * count_length:
+            raise ValueError('Preimage counter state has the wrong length')
+
+        counter = cls(height, int_from_bytes(data[header_size:start]) or None)
+        counter.num_columns = num_columns
+        counter.counts = [
+            int_from_bytes(data[start + i * count_length:
+                                start + (i + 1) * count_length])
+            for i in range(num_states)]
+
+        return counter
+
+
+'''
+    Bitboards
+
+    To check a candidate preimage, the whole grid can be evolved at once by
+    packing it into one int, one row after another, with the cells of row r
+    at bits r × stride to r × stride + width. Like evolve_column(), shifting
+    lines up the other cells of each 2x2 block with its top-left cell:
+        a = board, b = board >> 1,
+        c = board >> stride, d = board >> (stride + 1)
+    and then
+        gas = ((a ^ b) ^ (c ^ d)) & ~(a & b) & ~(c & d)
+    masked to the cells that are inside the grid, as the cells on the right
+    edge of each row line up with the start of the next row.
+
+    The evolved grid is one row and column smaller but keeps the same stride,
+    so it can be evolved again straight away.
+'''
+# Input: grid as a list of rows, and the number of bits per row
+def encode_bitboard(g, stride=None): # type: (list[list[bool]], int | None) -> int
+    if stride is None:
+        stride = len(g[0])
+
+    board = 0
+    for r, row in enumerate(g):
+        board |= column_to_int(row) << (r * stride)
+
+    return board
+
+# Input: bitboard of a (height + 1) × (width + 1) preimage
+# Output: bitboard of the height × width grid it evolves into, with the same
+#         stride
+def evolve_bitboard(board, width, height, stride=None):
+    # type: (int, int, int, int | None) -> int
+    if stride is None:
+        stride = width + 1
 
-        counts = next_columns
+    row_mask = (1 << width) - 1
+    mask = 0
+    for r in range(height):
+        mask |= row_mask << (r * stride)
 
-    return sum(counts.values())
+    a, b, c, d = board, board >> 1, board >> stride, board >> (stride + 1)
+    return ((a ^ b) ^ (c ^ d)) & ~(a & b) & ~(c & d) & mask
+
+def is_preimage(preimage, g): # type: (list[list[bool]], list[list[bool]]) -> bool
+    # Missing cells would otherwise just be read as empty
+    if len(preimage) != len(g) + 1 or any(len(row) != len(g[0]) + 1
+                                          for row in preimage):
+        return False
+
+    stride = len(preimage[0])
+    return evolve_bitboard(encode_bitboard(preimage), len(g[0]), len(g),
+                           stride) == encode_bitboard(g, stride)
+
+'''
+    Going back more than one generation
+
+    A state k generations back is a preimage of a preimage of ... of the grid,
+    so the preimages one generation back are listed one at a time, and the
+    ones k - 1 generations back of each of them are counted. Listing is a
+    depth-first search over the preimage columns, using the column pairs like
+    the counting does.
+
+    Most preimages don't have a preimage of their own though, and if the
+    first few columns of a preimage can't be evolved into, none of the rest of
+    it can be either. So as each column is added, the counts of preimages of
+    the columns so far are swept along with it (one generation further back),
+    and the search backs out as soon as they are all 0. For the last
+    generation, the counts at the end are the answer, so there's no need to
+    list the states of that generation at all.
+
+    The number of preimages to list still grows exponentially with the size
+    of the grid, so this is only practical for small grids or few
+    generations.
+'''
+# Input: bitmap-encoded columns of the gas grid, from left to right
+# Output: number of states that evolve into the grid after 'generations'
+#         steps
+def count_ancestors(encoded_columns, height, generations):
+    # type: (list[int], int, int) -> int
+    if generations == 0:
+        return 1
+    if generations == 1:
+        return count_preimages(encoded_columns, height)
+
+    tables = dict((column, create_possible_column_pairs(column, height))
+                  for column in set(encoded_columns))
+    # Preimage columns have height + 1 cells, so their preimages have
+    # height + 2 cells
+    start = [1] * (1 << (height + 2))
+
+    total = 0
+    stack = [([left], sweep_column(start, left, height + 1))
+             for left in range(1 << (height + 1))]
+    while stack:
+        preimage, counts = stack.pop()
+
+        if len(preimage) == len(encoded_columns) + 1:
+            if generations == 2:
+                total += sum(counts)
+            else:
+                total += count_ancestors(preimage, height + 1, generations - 1)
+            continue
+
+        column = encoded_columns[len(preimage) - 1]
+        for right in tables[column].get((column, preimage[-1]), []):
+            next_counts = sweep_column(counts, right, height + 1)
+            if any(next_counts):
+                stack.append((preimage + [right], next_counts))
+
+    return total
+
+# Output: number of states that evolve into the grid after 'generations' steps
+def count_generations(g, generations): # type: (list[list[bool]], int) -> int
+    if len(g) > len(g[0]):
+        g = transpose(g)
+
+    encoded_columns = list(map(column_to_int, transpose(g)))
+    return count_ancestors(encoded_columns, len(g), generations)
 
 
 # ============================ Official test-cases ============================
@@ -207,3 +1134,176 @@ assert solution([[True, False, True, False, False, True, True, True],
                  [True, True, True, False, False, False, True, False],
                  [True, False, True, False, False, False, True, False],
                  [True, False, True, False, False, True, True, True]]) == 254
+
+# =========== My own, unofficial test cases to help debug behaviour ===========
+# The table matches trying every pair of preimage columns
+for height in range(1, 6):
+    for column in range(1 << height):
+        table = create_possible_column_pairs(column, height)
+        for left in range(1 << (height + 1)):
+            assert sorted(table.get((column, left), [])) == [
+                right for right in range(1 << (height + 1))
+                if evolve_column(left, right, height) == column
+            ], "create_possible_column_pairs(...) failed!"
+
+# Counting modulo a number gives the same as the exact count, modulo it
+grid = [[True, True, False, True, False, True, False, True, True, False],
+        [True, True, False, False, False, False, True, True, True, False],
+        [True, True, False, False, False, False, False, False, False, True],
+        [False, True, False, False, False, False, True, True, False, False]]
+columns = list(map(column_to_int, transpose(grid)))
+for modulus in (1, 2, 1000, 10 ** 9 + 7, 1 << 62):
+    assert count_preimages(columns, 4, modulus) == 11567 % modulus, \
+        "count_preimages(..., " + str(modulus) + ") failed!"
+
+# Tall and thin grids give the same count as their transpose
+grid = [[True, False, True],
+        [False, True, False],
+        [True, False, True],
+        [False, False, False],
+        [True, True, False]]
+assert solution(grid) == solution(transpose(grid)), "solution(tall) failed!"
+
+# Sweeping down the rows agrees with the transfer matrices
+columns = [0b0101, 0b1111, 0b0000, 0b1001, 0b0110]
+assert count_preimages_by_rows(columns, 4) == \
+    count_preimages_by_matrices(columns, 4), "count_preimages_by_rows(...) failed!"
+
+# The least recently used transition matrix is evicted first
+cache = TransitionCache(max_size=2)
+first = cache.get(0b101, 3)
+cache.get(0b010, 3)
+assert cache.get(0b101, 3) is first, "TransitionCache.get(...) failed!"
+cache.get(0b111, 3)
+assert list(cache.matrices) == [(3, 0b101), (3, 0b111)], \
+    "TransitionCache eviction failed!"
+
+# Splitting the columns into segments gives the same count
+columns = [0b0101, 0b1111, 0b0000, 0b1001, 0b0110, 0b0011, 0b1000]
+for num_segments in (1, 2, 3, 7):
+    assert count_preimages_in_parallel(columns, 4, workers=0,
+                                       num_segments=num_segments) == \
+        count_preimages_by_rows(columns, 4), \
+        "count_preimages_in_parallel(...) failed!"
+    assert count_preimages_in_parallel(columns, 4, 1000, workers=0,
+                                       num_segments=num_segments) == \
+        count_preimages_by_rows(columns, 4, 1000), \
+        "count_preimages_in_parallel(..., 1000) failed!"
+
+# Too tall for the segment products to pay off, so counted in this process
+columns = [0b100101, 0b011010, 0b110011]
+assert count_preimages_in_parallel(columns, 6, 1000, workers=0) == \
+    count_preimages_by_rows(columns, 6, 1000), \
+    "count_preimages_in_parallel(..., height > MAX_PARALLEL_HEIGHT) failed!"
+
+# With a real pool. Only when run directly, as processes that are spawned
+# rather than forked import this file again
+if __name__ == '__main__':
+    columns = [0b101, 0b010, 0b111, 0b001, 0b000, 0b110, 0b011, 0b100, 0b101]
+    assert count_preimages_in_parallel(columns, 3, workers=4) == \
+        count_preimages_by_rows(columns, 3), \
+        "count_preimages_in_parallel(..., workers=4) failed!"
+    assert count_preimages_in_parallel(columns, 3, 7, workers=2) == \
+        count_preimages_by_rows(columns, 3, 7), \
+        "count_preimages_in_parallel(..., workers=2) failed!"
+
+# Repeating a pattern agrees with sweeping through every column
+pattern = [0b0110, 0b1001, 0b0000]
+for repetitions in (0, 1, 2, 5, 8):
+    assert count_repeated_preimages(pattern, repetitions, 4) == \
+        count_preimages_by_rows(pattern * repetitions, 4), \
+        "count_repeated_preimages(...) failed!"
+    assert count_repeated_preimages(pattern, repetitions, 4, 1000) == \
+        count_preimages_by_rows(pattern * repetitions, 4, 1000), \
+        "count_repeated_preimages(..., 1000) failed!"
+
+assert find_period([3, 1, 4, 3, 1, 4, 3, 1]) == 3, "find_period(...) failed!"
+assert find_period([3, 1, 4, 1, 5]) == 5, "find_period(...) failed!"
+# Enough repeats to use the matrices, with a partial repeat at the end
+columns = (pattern * 200)[:-1]
+assert count_preimages_by_period(columns, 4) == \
+    count_preimages_by_rows(columns, 4), "count_preimages_by_period(...) failed!"
+# Too few repeats, and no repeats at all
+for columns in ((pattern * 7)[:-1], [0b0101, 0b1111, 0b0000, 0b1001, 0b0110]):
+    assert count_preimages_by_period(columns, 4) == \
+        count_preimages_by_rows(columns, 4), \
+        "count_preimages_by_period(...) failed!"
+
+# Folding reflected states agrees with the unreduced engine
+for height in range(1, 7):
+    palindromes = [column for column in range(1 << height)
+                   if is_palindrome(column, height)]
+    columns = (palindromes * 3)[:7]
+    for modulus in (None, 1000):
+        assert count_preimages_by_symmetry(columns, height, modulus) == \
+            count_preimages_by_matrices(columns, height, modulus), \
+            "count_preimages_by_symmetry(...) failed!"
+
+# The bitboard agrees with evolving one column at a time
+preimage = [[True, False, True, True],
+            [False, False, True, False],
+            [True, True, False, False]]
+g = [[(evolve_column(column_to_int(left), column_to_int(right), 2) >> r) & 1 == 1
+      for left, right in zip(transpose(preimage), transpose(preimage)[1:])]
+     for r in range(2)]
+assert is_preimage(preimage, g), "is_preimage(...) failed!"
+g[0][0] = not g[0][0]
+assert not is_preimage(preimage, g), "is_preimage(...) failed!"
+# Candidates of the wrong shape aren't preimages
+assert not is_preimage([[False, False]], [[False]]), "is_preimage(...) failed!"
+assert not is_preimage([[True, False, False]], [[True, False]]), \
+    "is_preimage(...) failed!"
+assert not is_preimage([row[:-1] for row in preimage], g), \
+    "is_preimage(...) failed!"
+
+# Counting two generations back agrees with evolving every state twice
+for g in ([[True]], [[False, True]], [[True], [True]], [[False, False]]):
+    height, width = len(g), len(g[0])
+    stride = width + 2
+    target = encode_bitboard(g, stride)
+    count = 0
+    for state in range(1 << ((height + 2) * (width + 2))):
+        once = evolve_bitboard(state, width + 1, height + 1, stride)
+        if evolve_bitboard(once, width, height, stride) == target:
+            count += 1
+    assert count_generations(g, 2) == count, "count_generations(...) failed!"
+    assert count_generations(g, 1) == solution(g), "count_generations(...) failed!"
+
+# solution() counts modulo a number too, and the int64 path for small grids
+# agrees with the exact count
+grid = [[True, False, True, False, False, True, True, True],
+        [True, False, True, False, False, False, True, False],
+        [True, True, True, False, False, False, True, False],
+        [True, False, True, False, False, False, True, False],
+        [True, False, True, False, False, True, True, True]]
+assert solution(grid, 100) == 54, "solution(..., 100) failed!"
+columns = list(map(column_to_int, transpose(grid)))
+assert fits_in_int64(columns, 5), "fits_in_int64(...) failed!"
+assert not fits_in_int64(columns * 10, 5), "fits_in_int64(...) failed!"
+assert count_preimages_by_matrices(columns, 5) == \
+    count_preimages_by_rows(columns, 5), "count_preimages_by_matrices(...) failed!"
+
+# Streaming the columns in gives the same count, and can be saved part way
+# through and carried on from
+grid = [[True, True, False, True, False, True, False, True, True, False],
+        [True, True, False, False, False, False, True, True, True, False],
+        [True, True, False, False, False, False, False, False, False, True],
+        [False, True, False, False, False, False, True, True, False, False]]
+for modulus in (None, 1000):
+    counter = PreimageCounter(4, modulus)
+    for i, column in enumerate(transpose(grid)):
+        if i == 5:
+            counter = PreimageCounter.from_bytes(counter.to_bytes())
+        counter.push_column(column if i % 2 else column_to_int(column))
+    assert counter.num_columns == 10, "PreimageCounter.from_bytes(...) failed!"
+    assert counter.current_count() == solution(grid, modulus), \
+        "PreimageCounter.current_count() failed!"
+
+# The matrices are only used once they would make up for being built
+columns = [0b1010110, 0b0111001, 0b1100011]
+assert not matrices_pay_off(columns * 2, 7), "matrices_pay_off(...) failed!"
+for column in columns:
+    TRANSITION_CACHE.get(column, 7)
+assert matrices_pay_off(columns, 7), "matrices_pay_off(...) failed!"
+assert count_preimages(columns * 10, 7, 1000) == \
+    count_preimages_by_rows(columns * 10, 7, 1000), "count_preimages(...) failed!"
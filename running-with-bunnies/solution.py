@@ -1,7 +1,16 @@
 #!/usr/bin/env python2.7
-from copy import deepcopy
+from array import array
+from bisect import bisect_right
+from collections import deque
+from heapq import heappop, heappush
 from itertools import permutations
 
+# Not available in the Foobar sandbox, only used to speed up large graphs
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 '''
     Example graph visualised:
     This was difficult to draw - I couldn't put arrows so the convention is for
@@ -72,6 +81,9 @@ from itertools import permutations
                - This is fine as the problem statements says:
                      > There are at most 5 bunnies...
 
+    Update: Step 3 is now done with the Held-Karp algorithm (see held_karp()),
+    so we're no longer limited to a handful of bunnies.
+
     I still think there may be a smarter way to search step 3. I could not come
     up with a more efficient search myself and couldn't find a definitive
     answer either way.
@@ -82,67 +94,209 @@ from itertools import permutations
 '''
 
 
+'''
+    Only the distances are needed to find the bunnies, so the next_node matrix
+    for reconstructing the actual paths is only filled in if the caller asks
+    for it.
+
+    The inner loop works on whole rows at a time (distances[i] is improved by
+    going through k, using row k), which avoids most of the nested list
+    indexing, and skips rows that can't reach k at all.
+'''
 # Assumption: 'graph' is a square matrix
-def floyd_warshall(graph): # type: (list[list[int]]) -> list[list[int]] | None
+# Modifies 'next_node' if given!
+def floyd_warshall(graph, next_node=None):
+    # type: (list[list[int]], list[list[int | None]] | None) -> list[list[int]] | None
     # The total value/"distance" of taking the shortest path from
     # distances[source][target]
-    distances = deepcopy(graph)
+    distances = [list(row) for row in graph]
     n = len(graph) # number of vertices
-    # For next_node[source][target] = node,
-    # The fastest way from 'source' to 'target' is by taking 'node'
-    next_node = [[None for _ in range(n)] for _ in range(n)]
-
-    # Initialise with just going directly to the target node
-    # If an alternative, shorter path is found, it will be updated
-    for i in range(n):
-        for j in range(n):
-            if i == j: # Don't initialise the diagonal
-                next_node[i][j] = None
-            # See above note, it's not clear if we can assume all graphs will
-            # be complete digraphs...
-            # If not, it's not given how a disconnected edge is expressed
-            # either...
-            # I will assume it's by the value Infinity
-            elif graph[i][j] == float('inf'):
-                next_node[i][j] = -1
-            else:
-                next_node[i][j] = j
 
-    for k in range(n):
+    if next_node is not None:
+        # For next_node[source][target] = node,
+        # The fastest way from 'source' to 'target' is by taking 'node'
+        del next_node[:]
+        next_node.extend([None] * n for _ in range(n))
+
+        # Initialise with just going directly to the target node
+        # If an alternative, shorter path is found, it will be updated
         for i in range(n):
             for j in range(n):
-                if distances[i][j] > distances[i][k] + distances[k][j]:
-                    distances[i][j] = distances[i][k] + distances[k][j]
-                    next_node[i][j] = next_node[i][k]
+                if i == j: # Don't initialise the diagonal
+                    next_node[i][j] = None
+                # See above note, it's not clear if we can assume all graphs
+                # will be complete digraphs...
+                # If not, it's not given how a disconnected edge is expressed
+                # either...
+                # I will assume it's by the value Infinity
+                elif graph[i][j] == float('inf'):
+                    next_node[i][j] = -1
+                else:
+                    next_node[i][j] = j
+
+    for k in range(n):
+        via_k = distances[k]
+
+        for i in range(n):
+            row = distances[i]
+            to_k = row[k]
+
+            # Can't get anywhere faster through k if we can't reach k
+            if to_k != float('inf'):
+                for j in range(n):
+                    if row[j] > to_k + via_k[j]:
+                        row[j] = to_k + via_k[j]
+                        if next_node is not None:
+                            next_node[i][j] = next_node[i][k]
+
             # Negative cycle
-            if distances[i][i] < 0:
+            if row[i] < 0:
                 return None
 
     return distances
 
+'''
+    Vectorised Floyd-Warshall, for large graphs when NumPy is available (it
+    isn't in the Foobar sandbox).
+
+    For each k, every pair (i, j) is relaxed through k at once:
+        D = minimum(D, D[:, k] + D[k, :])
+    where D[:, k, None] + D[None, k, :] broadcasts the column and row of k
+    into the matrix of distances of going through k.
+
+    The dtype is int64 unless the graph uses infinity for missing edges, as
+    NumPy integers can't represent infinity.
+'''
+# Assumption: 'graph' is a square matrix
+def floyd_warshall_numpy(graph):
+    # type: (list[list[int]]) -> list[list[int]] | None
+    has_infinity = any(t == float('inf') for row in graph for t in row)
+    distances = numpy.array(
+        graph, dtype=numpy.float64 if has_infinity else numpy.int64)
+
+    for k in range(len(graph)):
+        numpy.minimum(distances,
+                      distances[:, k, None] + distances[None, k, :],
+                      out=distances)
+
+        # Negative cycle
+        if (distances.diagonal() < 0).any():
+            return None
+
+    # Looking up single elements is much faster in lists than NumPy arrays
+    return distances.tolist()
+
+
+'''
+    Johnson's algorithm
+    https://en.wikipedia.org/wiki/Johnson%27s_algorithm
+
+    Floyd-Warshall finds the shortest times between *every* pair of nodes in
+    O(n^3), but only the times between the start, the bunnies and the bulkhead
+    are ever used. If the graph also has lots of other corridor junctions, it's
+    much cheaper to search from just those k + 2 nodes.
+
+    Dijkstra's algorithm is the fast single-source search, but it can't handle
+    negative times. Johnson's trick is to "reweight" every edge with a
+    potential h:
+        w'(u, v) = w(u, v) + h(u) - h(v)
+    If h is the shortest distance from a virtual node joined to every node by
+    a 0 edge, then w'(u, v) >= 0 for every edge, and every path from s to t
+    changes by the same h(s) - h(t), so shortest paths stay shortest.
+
+    h is found with one pass of Bellman-Ford (the queue-based "SPFA" variant),
+    which also detects negative cycles: if a shortest path is ever found to
+    have n or more edges, it must go around a cycle.
+'''
+# Assumption: 'graph' is a square matrix, missing edges are infinity
+# Returns the shortest time from each node to every node, or None if there's
+# a negative cycle
+def bellman_ford_potentials(graph): # type: (list[list[int]]) -> list[int] | None
+    n = len(graph)
+    # The virtual node has a 0 edge to every node, so every node starts at 0
+    potential = [0] * n
+    # Number of edges in the path to each node (not counting the virtual edge)
+    num_edges = [0] * n
+    queue = deque(range(n))
+    in_queue = [True] * n
+
+    while queue:
+        u = queue.popleft()
+        in_queue[u] = False
+
+        for v, time in enumerate(graph[u]):
+            if time == float('inf'):
+                continue
+
+            if potential[u] + time < potential[v]:
+                potential[v] = potential[u] + time
+                num_edges[v] = num_edges[u] + 1
+
+                # Negative cycle
+                if num_edges[v] >= n:
+                    return None
+
+                if not in_queue[v]:
+                    queue.append(v)
+                    in_queue[v] = True
+
+    return potential
+
+# Assumption: 'graph' is a square matrix, missing edges are infinity
+# Returns the shortest times between 'nodes', in the order given, or None if
+# there's a negative cycle
+def johnson(graph, nodes): # type: (list[list[int]], list[int]) -> list[list[int]] | None
+    potential = bellman_ford_potentials(graph)
+    if potential is None:
+        return None
+
+    n = len(graph)
+    # Reweighted, non-negative edges as adjacency lists
+    # The diagonal is skipped - a negative self-loop would have been a
+    # negative cycle, and any other self-loop is never on a shortest path
+    neighbours = [[(v, time + potential[u] - potential[v])
+                   for v, time in enumerate(row)
+                   if time != float('inf') and u != v]
+                  for u, row in enumerate(graph)]
 
-def solution(times, times_limit): # type: (list[list[int]], int) -> list[int]
-    shortest_times = floyd_warshall(times)
-    num_bunnies = len(times) - 2
+    shortest_times = []
+    for source in nodes:
+        distance = [float('inf')] * n
+        distance[source] = 0
+        done = [False] * n
+        remaining = set(nodes)
+        heap = [(0, source)]
+
+        # Dijkstra, stopping once all of 'nodes' have been reached
+        while heap and remaining:
+            d, u = heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+            remaining.discard(u)
+
+            for v, time in neighbours[u]:
+                if d + time < distance[v]:
+                    distance[v] = d + time
+                    heappush(heap, (distance[v], v))
+
+        # Undo the reweighting
+        shortest_times.append(
+            [distance[t] - potential[source] + potential[t]
+             if distance[t] != float('inf') else float('inf')
+             for t in nodes])
+
+    return shortest_times
+
+
+# Exhaustively test *all permutations* of *all subsets* of bunnies
+def permutation_search(shortest_times, times_limit):
+    # type: (list[list[int]], int) -> list[int]
+    num_bunnies = len(shortest_times) - 2
     # Just to make the code easier to read
     start = 0
-    bulkhead = len(times) - 1
+    bulkhead = len(shortest_times) - 1
 
-    # Negative cycles present - we can rescue all bunnies
-    if not shortest_times:
-        return list(range(num_bunnies))
-
-    '''
-        We must exhaustively test *all permutations* of *all subsets* of
-        bunnies :'(
-        i.e. every single possible bunny path permutation
-        Might be able to do this (a little) more efficiently by using depth-first
-        search to explore all permutations, but stop searching a path further if
-        we already exceed the time limit.
-        But problem states:
-            > There are at most 5 bunnies...
-        So it's worth it just to do this a simpler yet more inefficient way
-    '''
     # reverse() so that we can get the largest subset of bunnies first and exit
     for subset_size in reversed(range(1, num_bunnies + 1)):
         for bunnies in permutations(range(1, num_bunnies + 1), r=subset_size):
@@ -166,6 +320,276 @@ def solution(times, times_limit): # type: (list[list[int]], int) -> list[int]
     # None can be saved :(
     return []
 
+'''
+    Held-Karp algorithm
+    https://en.wikipedia.org/wiki/Held%E2%80%93Karp_algorithm
+
+    This is really a travelling salesman problem on the bunnies, and the
+    permutation search above is O(k!) for k bunnies. Instead, notice that the
+    fastest way to pick up a set of bunnies, ending at bunny b, only depends on
+    *which* bunnies have been picked up and b - not the order they were picked
+    up in. So we can build it up one bunny at a time:
+        time[{b}][b] = shortest_times[start][b]
+        time[S + {c}][c] = min over b in S of time[S][b] + shortest_times[b][c]
+    with the sets of bunnies S encoded as bitmasks.
+    That's O(2^k k) states and O(2^k k^2) time.
+
+    A set S is feasible if, for some b, time[S][b] + shortest_times[b][bulkhead]
+    is within the time limit.
+
+    As there are no negative cycles, shortest_times obeys the triangle
+    inequality, so any route from b that picks up more bunnies and then goes to
+    the bulkhead takes at least shortest_times[b][bulkhead]. So states that
+    can't reach the bulkhead in time can never be extended into a feasible set,
+    and are skipped.
+'''
+# rescue[mask] = fastest time to pick up the bunnies in 'mask' and get to the
+# bulkhead. Routes slower than 'times_limit' aren't explored, so their sets may
+# be left at infinity.
+def rescue_times(shortest_times, times_limit=float('inf')):
+    # type: (list[list[int]], int) -> array
+    num_bunnies = len(shortest_times) - 2
+    start = 0
+    bulkhead = len(shortest_times) - 1
+    inf = float('inf')
+
+    # Bunny b is row/column b + 1 of shortest_times
+    from_start = [shortest_times[start][b + 1] for b in range(num_bunnies)]
+    to_bulkhead = [shortest_times[b + 1][bulkhead] for b in range(num_bunnies)]
+    between = [[shortest_times[b + 1][c + 1] for c in range(num_bunnies)]
+               for b in range(num_bunnies)]
+
+    # time[mask * num_bunnies + b] = fastest time to pick up bunnies in 'mask',
+    # ending at bunny b
+    time = array('d', [inf]) * ((1 << num_bunnies) * num_bunnies)
+    for b in range(num_bunnies):
+        time[(1 << b) * num_bunnies + b] = from_start[b]
+
+    rescue = array('d', [inf]) * (1 << num_bunnies)
+    rescue[0] = shortest_times[start][bulkhead]
+
+    # Every subset of 'mask' is smaller than 'mask', so counting upwards means
+    # every state is final before it is extended
+    for mask in range(1, 1 << num_bunnies):
+        row = mask * num_bunnies
+        # (c, state for mask + {c} ending at c) for every c not in 'mask'
+        extensions = [(c, (mask | (1 << c)) * num_bunnies + c)
+                      for c in range(num_bunnies) if not mask & (1 << c)]
+
+        for b in range(num_bunnies):
+            elapsed = time[row + b]
+            if elapsed + to_bulkhead[b] > times_limit:
+                continue
+            rescue[mask] = min(rescue[mask], elapsed + to_bulkhead[b])
+
+            between_b = between[b]
+            for c, state in extensions:
+                if elapsed + between_b[c] < time[state]:
+                    time[state] = elapsed + between_b[c]
+
+    return rescue
+
+def held_karp(shortest_times, times_limit):
+    # type: (list[list[int]], int) -> list[int]
+    num_bunnies = len(shortest_times) - 2
+    rescue = rescue_times(shortest_times, times_limit)
+
+    best = [] # type: list[int]
+    for mask in range(1, 1 << num_bunnies):
+        if rescue[mask] <= times_limit:
+            bunnies = [b for b in range(num_bunnies) if mask & (1 << b)]
+            if (len(bunnies) > len(best)
+                    or (len(bunnies) == len(best) and bunnies < best)):
+                best = bunnies
+
+    return best
+
+'''
+    Branch-and-bound depth-first search
+
+    Build routes one bunny at a time, and stop extending a route as soon as it
+    can't make it back to the bulkhead in time. As shortest_times obeys the
+    triangle inequality, picking up more bunnies from b and then going to the
+    bulkhead takes at least shortest_times[b][bulkhead], so:
+        - A route is abandoned if elapsed + to_bulkhead[b] > limit
+        - Before moving to bunny c, check it could still reach the bulkhead
+          from c in time: elapsed + between[b][c] + to_bulkhead[c] <= limit
+        - A route is also abandoned if another route that picked up the same
+          bunnies and ended at the same bunny already got there at least as
+          fast - whatever it can do next, so could the faster one
+    The search stops straight away if all bunnies can be rescued.
+
+    Timed with timeit in Python 2.7, on random stations with times from 1 to
+    20 and a time limit of 10:
+        |  bunnies  | permutation_search | depth_first_search | held_karp |
+        |:---------:|:------------------:|:------------------:|:---------:|
+        |     5     |       0.34 ms      |       0.01 ms      |  0.09 ms  |
+        |     9     |        1.6 s       |       0.14 ms      |   3.9 ms  |
+    The permutation search is only competitive when nearly every route is in
+    time, as then the very first permutation it tries is an answer.
+'''
+def depth_first_search(shortest_times, times_limit):
+    # type: (list[list[int]], int) -> list[int]
+    num_bunnies = len(shortest_times) - 2
+    start = 0
+    bulkhead = len(shortest_times) - 1
+    all_bunnies = (1 << num_bunnies) - 1
+
+    # Bunny b is row/column b + 1 of shortest_times
+    from_start = [shortest_times[start][b + 1] for b in range(num_bunnies)]
+    to_bulkhead = [shortest_times[b + 1][bulkhead] for b in range(num_bunnies)]
+    between = [[shortest_times[b + 1][c + 1] for c in range(num_bunnies)]
+               for b in range(num_bunnies)]
+
+    # (bunnies picked up, last bunny) -> fastest time seen
+    fastest = {} # type: dict[tuple[int, int], int]
+    # Sets of bunnies that can be rescued in time
+    feasible = set() # type: set[int]
+
+    # Reversed, so that the lowest bunnies are popped first
+    stack = [(1 << b, b, from_start[b]) for b in reversed(range(num_bunnies))
+             if from_start[b] + to_bulkhead[b] <= times_limit]
+
+    while stack:
+        mask, b, elapsed = stack.pop()
+
+        if fastest.get((mask, b), float('inf')) <= elapsed:
+            continue
+        fastest[(mask, b)] = elapsed
+        feasible.add(mask)
+
+        if mask == all_bunnies:
+            return list(range(num_bunnies))
+
+        between_b = between[b]
+        for c in reversed(range(num_bunnies)):
+            if mask & (1 << c):
+                continue
+            if elapsed + between_b[c] + to_bulkhead[c] <= times_limit:
+                stack.append((mask | (1 << c), c, elapsed + between_b[c]))
+
+    best = [] # type: list[int]
+    for mask in feasible:
+        bunnies = [b for b in range(num_bunnies) if mask & (1 << b)]
+        if (len(bunnies) > len(best)
+                or (len(bunnies) == len(best) and bunnies < best)):
+            best = bunnies
+
+    return best
+
+SEARCH_METHODS = {
+    'permutations': permutation_search,
+    'held-karp': held_karp,
+    'depth-first': depth_first_search
+}
+
+# bunnies: the nodes of 'times' holding bunnies, in worker ID order. By
+# default every node between the start and the bulkhead. Any other nodes are
+# just corridor junctions.
+# Returns the shortest times between the start, the bunnies and the bulkhead
+# (in that order), or None if there's a negative cycle
+def find_shortest_times(times, bunnies=None):
+    # type: (list[list[int]], list[int] | None) -> list[list[int]] | None
+    start = 0
+    bulkhead = len(times) - 1
+    if bunnies is None:
+        bunnies = list(range(1, bulkhead))
+
+    # Only the start, the bunnies and the bulkhead matter - if there are
+    # other nodes, just search from these
+    nodes = [start] + list(bunnies) + [bulkhead]
+    if len(nodes) < len(times):
+        return johnson(times, nodes)
+
+    if numpy is not None:
+        shortest_times = floyd_warshall_numpy(times)
+    else:
+        shortest_times = floyd_warshall(times)
+
+    # The bunnies might not be in node order
+    if shortest_times is None or nodes == list(range(len(times))):
+        return shortest_times
+    return [[shortest_times[u][v] for v in nodes] for u in nodes]
+
+# bunnies: see find_shortest_times()
+def solution(times, times_limit, search='held-karp', bunnies=None):
+    # type: (list[list[int]], int, str, list[int] | None) -> list[int]
+    shortest_times = find_shortest_times(times, bunnies)
+    num_bunnies = len(times) - 2 if bunnies is None else len(bunnies)
+
+    # Negative cycles present - we can rescue all bunnies
+    if not shortest_times:
+        return list(range(num_bunnies))
+
+    if search not in SEARCH_METHODS:
+        raise ValueError('Unknown search method: ' + search)
+
+    return SEARCH_METHODS[search](shortest_times, times_limit)
+
+
+'''
+    Many time limits, one station
+
+    Everything except the very last step is independent of the time limit: the
+    shortest times, and the fastest way to rescue each set of bunnies. So work
+    out the fastest rescue of every set once (Held-Karp without pruning), then
+    each time limit is just a lookup.
+
+    Sort the sets from best to worst answer (most bunnies, then lowest worker
+    IDs). The answer for a time limit is the first set in that order that can
+    be rescued in time. A set can only ever be that answer if it is faster than
+    every set before it, so only those sets are kept - the "frontier". Along
+    the frontier the rescue times strictly decrease, so the answer is the
+    frontier set with the largest rescue time within the limit, found with a
+    binary search.
+'''
+class RescuePlanner(object):
+    def __init__(self, times, bunnies=None):
+        # type: (list[list[int]], list[int] | None) -> None
+        shortest_times = find_shortest_times(times, bunnies)
+        num_bunnies = len(times) - 2 if bunnies is None else len(bunnies)
+
+        # Negative cycles present - we can always rescue all bunnies
+        if not shortest_times:
+            self.frontier_times = [float('-inf')]
+            self.frontier_bunnies = [list(range(num_bunnies))]
+            return
+
+        rescue = rescue_times(shortest_times)
+
+        # Sort sets of bunnies by size, then by lowest worker IDs. For two sets
+        # of the same size, the one with the lowest worker ID that isn't in
+        # both is better - which is the set with the larger bit-reversed mask.
+        size = [0] * (1 << num_bunnies)
+        reverse = [0] * (1 << num_bunnies)
+        for mask in range(1, 1 << num_bunnies):
+            size[mask] = size[mask >> 1] + (mask & 1)
+            reverse[mask] = ((reverse[mask >> 1] >> 1)
+                             | ((mask & 1) << (num_bunnies - 1)))
+        order = sorted(range(1 << num_bunnies),
+                       key=lambda mask: (size[mask], reverse[mask]),
+                       reverse=True)
+
+        frontier = [] # type: list[tuple[float, int]]
+        fastest = float('inf')
+        for mask in order:
+            if rescue[mask] < fastest:
+                fastest = rescue[mask]
+                frontier.append((rescue[mask], mask))
+
+        # Nobody can be saved at all below the fastest time
+        frontier.append((float('-inf'), 0))
+        frontier.reverse()
+
+        self.frontier_times = [time for time, _ in frontier]
+        self.frontier_bunnies = [
+            [b for b in range(num_bunnies) if mask & (1 << b)]
+            for _, mask in frontier]
+
+    def query(self, times_limit): # type: (int) -> list[int]
+        i = bisect_right(self.frontier_times, times_limit) - 1
+        return list(self.frontier_bunnies[i])
+
 
 # ============================ Official test-cases ============================
 assert solution([[0, 2, 2, 2, -1],
@@ -180,3 +604,94 @@ assert solution([[0, 1, 1, 1, 1],
                  [1, 1, 1, 0, 1],
                  [1, 1, 1, 1, 0]],
                 3) == [0, 1]
+
+# =========== My own, unofficial test cases to help debug behaviour ===========
+for search in SEARCH_METHODS:
+    assert solution([[0, 2, 2, 2, -1],
+                     [9, 0, 2, 2, -1],
+                     [9, 3, 0, 2, -1],
+                     [9, 3, 2, 0, -1],
+                     [9, 3, 2, 2, 0]],
+                    1, search) == [1, 2], search + " failed!"
+    assert solution([[0, 1, 1, 1, 1],
+                     [1, 0, 1, 1, 1],
+                     [1, 1, 0, 1, 1],
+                     [1, 1, 1, 0, 1],
+                     [1, 1, 1, 1, 0]],
+                    3, search) == [0, 1], search + " failed!"
+    # Negative cycle between start and bunny 0
+    assert solution([[0, -2, 5, 5],
+                     [1, 0, 5, 5],
+                     [5, 5, 0, 5],
+                     [5, 5, 5, 0]],
+                    0, search) == [0, 1], search + " failed!"
+    # Not enough time to save anyone
+    assert solution([[0, 2, 2],
+                     [2, 0, 2],
+                     [2, 2, 0]],
+                    1, search) == [], search + " failed!"
+
+# 12 bunnies, each 1 apart, with time for 10 of them
+assert held_karp([[0 if i == j else 1 for j in range(14)] for i in range(14)],
+                 11) == list(range(10)), "held_karp(...) failed!"
+
+# Paths are only reconstructed when asked for
+next_node = []
+assert floyd_warshall([[0, 5, 1],
+                       [5, 0, 5],
+                       [5, 1, 0]], next_node) == [[0, 2, 1],
+                                                  [5, 0, 5],
+                                                  [5, 1, 0]]
+assert next_node == [[None, 2, 2],
+                     [0, None, 2],
+                     [0, 1, None]], "floyd_warshall(...) next_node failed!"
+
+if numpy is not None:
+    times = [[0, 2, float('inf'), 2, -1],
+             [9, 0, 2, 2, -1],
+             [9, 3, 0, 2, -1],
+             [9, 3, float('inf'), 0, -1],
+             [9, 3, 2, 2, 0]]
+    assert floyd_warshall_numpy(times) == floyd_warshall(times)
+    assert floyd_warshall_numpy([[0, -1], [-1, 0]]) is None
+
+# Johnson's algorithm agrees with Floyd-Warshall
+times = [[0, 2, 2, 2, -1],
+         [9, 0, 2, 2, -1],
+         [9, 3, 0, 2, -1],
+         [9, 3, 2, 0, -1],
+         [9, 3, 2, 2, 0]]
+assert johnson(times, range(5)) == floyd_warshall(times), "johnson(...) failed!"
+assert johnson([[0, -1], [-1, 0]], [0, 1]) is None, "johnson(...) failed!"
+
+# Start -> junction 1 -> bunny (node 2) -> junction 3 -> bulkhead
+inf = float('inf')
+times = [[0, 1, inf, inf, inf],
+         [inf, 0, 1, inf, inf],
+         [inf, inf, 0, -1, inf],
+         [inf, inf, inf, 0, 1],
+         [inf, inf, inf, inf, 0]]
+assert solution(times, 2, bunnies=[2]) == [0], "solution(...) failed!"
+assert solution(times, 1, bunnies=[2]) == [], "solution(...) failed!"
+
+# Every node is a bunny, but the worker IDs aren't in node order
+times = [[0, 0, 5, 1],
+         [0, 0, 5, 1],
+         [5, 5, 0, 5],
+         [1, 1, 5, 0]]
+assert solution(times, 1) == [0], "solution(...) failed!"
+assert solution(times, 1, bunnies=[2, 1]) == [1], "solution(...) failed!"
+assert RescuePlanner(times, bunnies=[2, 1]).query(1) == [1], \
+    "RescuePlanner(...) failed!"
+
+times = [[0, 2, 2, 2, -1],
+         [9, 0, 2, 2, -1],
+         [9, 3, 0, 2, -1],
+         [9, 3, 2, 0, -1],
+         [9, 3, 2, 2, 0]]
+planner = RescuePlanner(times)
+assert [planner.query(limit) for limit in range(-1, 5)] == [
+    [], [1], [1, 2], [0, 1], [0, 1, 2], [0, 1, 2]
+], "RescuePlanner(...).query(...) failed!"
+for limit in range(-1, 5):
+    assert planner.query(limit) == solution(times, limit), "query(...) failed!"
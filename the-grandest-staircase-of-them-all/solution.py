@@ -1,4 +1,6 @@
 #!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+# UTF-8 for the mathematical symbols in comments
 
 '''
     Manually calculating the stair combinations for integer 3 <= n <= 9
@@ -78,8 +80,79 @@ def calc_num_staircases_memoised(n): # type: (int) -> int
 #     print " return count: ", count
 #     return count
 
-def solution(n): # type: (int) -> int
-    return calc_num_staircases_memoised(n)
+'''
+    The memoised version needs an (n + 2) × (n + 2) cache and recurses n
+    levels deep, so it runs out of memory or stack long before n gets into
+    the thousands. There is a recurrence that only needs the counts for
+    smaller n, from Euler's pentagonal number theorem:
+        ∏ (1 - x^k) = ∑ (-1)^k x^(k(3k - 1) / 2)    (k = 0, ±1, ±2, ...)
+    where the k(3k - 1) / 2 are the "generalised pentagonal numbers"
+    1, 2, 5, 7, 12, 15, ... (k = 1, -1, 2, -2, 3, -3, ...).
+
+    Partitions with distinct parts have the generating function
+        Q(x) = ∏ (1 + x^k)
+    and (1 + x^k)(1 - x^k) = 1 - x^(2k), so
+        Q(x) × ∏ (1 - x^k) = ∏ (1 - x^(2k))
+    Comparing the coefficients of x^n on both sides:
+        Q(n) = [n = 2g for pentagonal g = k(3k - 1) / 2] (-1)^k
+               + ∑ (-1)^(k + 1) Q(n - k(3k - 1) / 2)    (k = ±1, ±2, ...)
+    There are only about 2 √(2n / 3) pentagonal numbers up to n, so this is
+    O(n √n) time and O(n) memory, with no recursion - n = 100000 takes a few
+    seconds. The counts get huge (Q(100000) has 245 digits), so they can
+    be worked out modulo a number instead.
+'''
+# Output: the generalised pentagonal numbers up to n, split into those with
+#         a + and - sign in the recurrence for Q(n)
+def generalised_pentagonal_numbers(n): # type: (int) -> tuple[list[int], list[int]]
+    plus = []
+    minus = []
+
+    k = 1
+    while k * (3 * k - 1) // 2 <= n:
+        # k and -k
+        for pentagonal in (k * (3 * k - 1) // 2, k * (3 * k + 1) // 2):
+            if pentagonal <= n:
+                (plus if k % 2 else minus).append(pentagonal)
+        k += 1
+
+    return plus, minus
+
+# Output: the number of partitions of 0, 1, ..., n into distinct parts, modulo
+#         'modulus' if given
+def calc_num_distinct_partitions(n, modulus=None):
+    # type: (int, int | None) -> list[int]
+    plus, minus = generalised_pentagonal_numbers(n)
+
+    # The ∏ (1 - x^(2k)) side
+    doubled = [0] * (n + 1)
+    for pentagonal in plus:
+        if 2 * pentagonal <= n:
+            doubled[2 * pentagonal] = -1
+    for pentagonal in minus:
+        if 2 * pentagonal <= n:
+            doubled[2 * pentagonal] = 1
+
+    counts = [1] + [0] * n
+    # How many of the pentagonal numbers are <= m
+    num_plus = num_minus = 0
+
+    for m in range(1, n + 1):
+        while num_plus < len(plus) and plus[num_plus] <= m:
+            num_plus += 1
+        while num_minus < len(minus) and minus[num_minus] <= m:
+            num_minus += 1
+
+        count = (doubled[m]
+                 + sum([counts[m - pentagonal] for pentagonal in plus[:num_plus]])
+                 - sum([counts[m - pentagonal] for pentagonal in minus[:num_minus]]))
+        counts[m] = count % modulus if modulus is not None else count
+
+    return counts
+
+def solution(n, modulus=None): # type: (int, int | None) -> int
+    # Take away the one "staircase" with just one step, {n}
+    num_staircases = calc_num_distinct_partitions(n, modulus)[n] - 1
+    return num_staircases % modulus if modulus is not None else num_staircases
 
 
 # ============================ Official test-cases ============================
@@ -94,3 +167,16 @@ assert solution(6) == 3, 'solution(6) failed!'
 assert solution(7) == 4, 'solution(7) failed!'
 assert solution(8) == 5, 'solution(8) failed!'
 assert solution(9) == 7, 'solution(9) failed!'
+
+# The recurrence agrees with the memoised version
+for n in range(1, 150):
+    assert solution(n) == calc_num_staircases_memoised(n), \
+        'solution(' + str(n) + ') failed!'
+
+# Counting modulo a number gives the same as the exact count, modulo it, and
+# n can be far bigger than the memoised version could manage
+for modulus in (2, 1000, 10 ** 9 + 7):
+    assert solution(200, modulus) == 487067745 % modulus, \
+        'solution(200, ' + str(modulus) + ') failed!'
+    assert solution(5000, modulus) == solution(5000) % modulus, \
+        'solution(5000, ' + str(modulus) + ') failed!'